@@ -11,12 +11,9 @@ import despyfitsutils.fitsutils as fitsutils
 
 def read_list(listname):
     """ Read input catalog names from list file """
-    incats = []
-    with open(listname, 'r') as listfh:
-        incats = listfh.readlines()
-
     # Strip \n from list if present
-    return [f.strip() for f in incats]
+    with open(listname, 'r') as listfh:
+        return [f.strip() for f in listfh]
 
 def main():
     """ Entry point """
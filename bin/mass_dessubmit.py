@@ -158,7 +158,7 @@ def main(argv):
     origtname = args['templatewcl']
     origtwcl = None
     with open(origtname, 'r') as twclfh:
-        origtwcl = ''.join(twclfh.readlines())
+        origtwcl = twclfh.read()
 
     with open(args['submitlist'], 'r') as sublistfh:
         for line in sublistfh:
@@ -8,23 +8,35 @@
 
 """ Executes a series of wrappers within a single job """
 
+from __future__ import print_function
+
 import re
+import errno
 import subprocess
 import argparse
 import sys
 import os
 import time
 import shutil
-import copy
+import stat
 import traceback
 import socket
-from collections import OrderedDict
 import multiprocessing as mp
 import multiprocessing.pool as pl
 import signal
 import threading
-import Queue
-import psutil
+try:
+    import queue
+except ImportError:
+    # python 2
+    import Queue as queue
+import itertools
+import collections
+try:
+    # shared-memory ring buffer, much cheaper per message than a pipe-backed queue
+    from faster_fifo import Queue as LogQueue
+except ImportError:
+    LogQueue = mp.Queue
 
 import despymisc.miscutils as miscutils
 import despymisc.provdefs as provdefs
@@ -52,9 +64,59 @@ result_lock = threading.Lock()
 lock_monitor = threading.Condition(threading.Lock())
 donejobs = 0
 results = None
+worker_queues = (None, None)
+# number of wrappers this process's pool runs at once, 1 outside a pool
+pool_width = 1
+log_queues = []
+log_readers = []
+
+# queued wrapper output is sent once this many characters are buffered
+# or this many seconds have passed since the last send
+WRAPOUT_BUFSIZE = 4096
+WRAPOUT_MAXWAIT = 0.1
+# how long a log reader blocks on an idle queue before trying again
+LOGQ_TIMEOUT = 60
+# most file names listed when reporting a set of failed files
+MAX_LISTED_FILES = 50
+# threads walking the job dir's subdirectories at once when looking for junk
+WALK_THREADS = 8
+# fewest wanted files in a directory for list_existing_files to list it
+# instead of checking each of them
+LIST_DIR_MIN_FILES = 16
+# characters that make miscutils.fwsplit do more than split and strip
+FWSPLIT_SPECIAL = re.compile(r'[][():]')
+# exec section names, same form get_exec_sections accepts
+EXECNUM_RE = re.compile(r'^' + re.escape(pfwdefs.IW_EXECPREFIX) + r'(\d+)$')
+
+# wrapper outputs left for the main process to send: [(dest, saveinfo, task_label)]
+pending_transfers = []
+# threads sending wrapper outputs to the archives while later wrappers run,
+# one per wrapper the current group runs at once.  Each transfer puts its
+# (wrapnum, dest, success) on transfers_done when it ends
+transfer_pool = None
+transfer_width = 1
+transfers_done = queue.Queue()
+# wrappers that returned but whose outputs are still being sent:
+#   wrapnum -> {'exitcode', 'wcl', 'left': transfers not yet ended}
+wrappers_transferring = {}
+# filemgmt objects already created: (pid, filemgmt class, archive name) -> object
+filemgmt_cache = {}
+filemgmt_lock = threading.Lock()
+# total seconds spent per DESDMTIME label, summarized at the end of the job
+desdm_times = {}
+# absolute paths of job-level directories this process already made
+made_dirs = set()
 
 os.environ['PYTHONUNBUFFERED'] = '1'
 
+# debug levels are fixed for the life of the job, so check them only once
+DBG1 = miscutils.fwdebug_check(1, "PFWRUNJOB_DEBUG")
+DBG3 = miscutils.fwdebug_check(3, "PFWRUNJOB_DEBUG")
+DBG6 = miscutils.fwdebug_check(6, "PFWRUNJOB_DEBUG")
+DBG9 = miscutils.fwdebug_check(9, "PFWRUNJOB_DEBUG")
+DBG11 = miscutils.fwdebug_check(11, "PFWRUNJOB_DEBUG")
+DBG13 = miscutils.fwdebug_check(13, "PFWRUNJOB_DEBUG")
+
 class WrapOutput(object):
     """ Class to capture printed output and stdout and reformat it to append
         the wrapper number to the lines
@@ -65,14 +127,22 @@ class WrapOutput(object):
             The wrapper number to prepend to the lines
 
     """
+    # write is called for every print in a wrapper, keep attribute access cheap
+    __slots__ = ('isqueue', 'connection', 'wrapnum', '_prefix', '_partial', '_buf', '_bufbytes',
+                 '_lastput')
+
     def __init__(self, wrapnum, connection):
         try:
-            self.isqueue = not isinstance(connection, file)
+            self.isqueue = hasattr(connection, 'put')
             self.connection = connection
             self.wrapnum = int(wrapnum)
+            self._prefix = "\n%04d: " % (self.wrapnum)
+            self._partial = ""
+            self._buf = []
+            self._bufbytes = 0
+            self._lastput = time.time()
         except:
-            (extype, exvalue, trback) = sys.exc_info()
-            traceback.print_exception(extype, exvalue, trback, file=sys.stdout)
+            traceback.print_exc(file=sys.stdout)
 
     def write(self, text):
         """ Method to capture, reformat, and write out the requested text
@@ -84,84 +154,138 @@ class WrapOutput(object):
 
         """
         try:
-            text = text.rstrip()
-            if not text == 0:
+            # print writes its arguments, separators and end separately, so only
+            # pass on whole lines and hold back the rest until its newline arrives
+            lines = (self._partial + text).split("\n")
+            self._partial = lines.pop()
+            prefix = self._prefix
+            text = "".join([prefix + line for line in [line.rstrip() for line in lines] if line])
+            if not text:
                 return
-            text = text.replace("\n", "\n%04d: " % (self.wrapnum))
-            text = "\n%04d: " % (self.wrapnum) + text
             if self.isqueue:
-                self.connection.put(text, timeout=120)
+                self._buf.append(text)
+                bufbytes = self._bufbytes + len(text)
+                self._bufbytes = bufbytes
+                if bufbytes > WRAPOUT_BUFSIZE or \
+                   time.time() - self._lastput > WRAPOUT_MAXWAIT:
+                    self._put()
             else:
+                # left to the stream's own buffering, job_thread flushes around
+                # the wrapper run and close() flushes at the end
                 self.connection.write(text)
-                self.connection.flush()
         except:
-            (extype, exvalue, trback) = sys.exc_info()
-            traceback.print_exception(extype, exvalue, trback, file=sys.stdout)
+            traceback.print_exc(file=sys.stdout)
+
+    def _put(self):
+        """ Send all buffered text to the queue as a single message
+        """
+        if self._buf:
+            self.connection.put("".join(self._buf), timeout=120)
+            self._buf = []
+            self._bufbytes = 0
+        self._lastput = time.time()
 
     def close(self):
         """ Method to return stdout to its original handle
         """
+        if self._partial:
+            self.write("\n")
         if not self.isqueue:
+            self.connection.flush()
             return self.connection
+        self._put()
         return None
 
     def flush(self):
         """ Method to force the buffer to flush
 
         """
-        if not self.isqueue:
+        if self.isqueue:
+            self._put()
+        else:
             self.connection.flush()
 
 
+######################################################################
+def print_desdmtime(label, starttime):
+    """ Print the DESDMTIME line for a step started at starttime (from
+        time.time) and add it to the job totals """
+    elapsed = time.time() - starttime
+    desdm_times[label] = desdm_times.get(label, 0.0) + elapsed
+    sys.stdout.write("DESDMTIME: %s %0.3f\n" % (label, elapsed))
+
+
+######################################################################
+def take_desdm_times():
+    """ Remove and return the DESDMTIME totals of this process """
+    global desdm_times
+    times = desdm_times
+    desdm_times = {}
+    return times
+
+
+######################################################################
+def summarize_files(fnames):
+    """ Return a printable list of the given file names, cut off after
+        MAX_LISTED_FILES names so huge failures don't flood the log """
+    listed = list(itertools.islice(fnames, MAX_LISTED_FILES))
+    if len(fnames) > MAX_LISTED_FILES:
+        return "%d files, first %d: %s" % (len(fnames), MAX_LISTED_FILES, ', '.join(listed))
+    return ', '.join(listed)
+
+
+######################################################################
+def archive_levels(wcl, direction='output'):
+    """ Return the (target, home) archive usage levels for job outputs,
+        or for job inputs if direction is 'input', 'never' if not set """
+    if direction == 'input':
+        keys = (pfwdefs.USE_TARGET_ARCHIVE_INPUT, pfwdefs.USE_HOME_ARCHIVE_INPUT)
+    else:
+        keys = (pfwdefs.USE_TARGET_ARCHIVE_OUTPUT, pfwdefs.USE_HOME_ARCHIVE_OUTPUT)
+    return tuple(wcl.get(key, default='never').lower() for key in keys)
+
+
 ######################################################################
 def save_trans_end_of_job(wcl, jobfiles, putinfo):
     """ If transfering at end of job, save file info for later """
 
-    if miscutils.fwdebug_check(3, "PFWRUNJOB_DEBUG"):
+    if DBG3:
         miscutils.fwdebug_print("BEG")
         miscutils.fwdebug_print("len(putinfo) = %d" % len(putinfo))
 
-    job2target = 'never'
-    if pfwdefs.USE_TARGET_ARCHIVE_OUTPUT in wcl:
-        job2target = wcl[pfwdefs.USE_TARGET_ARCHIVE_OUTPUT].lower()
-    job2home = 'never'
-    if pfwdefs.USE_HOME_ARCHIVE_OUTPUT in wcl:
-        job2home = wcl[pfwdefs.USE_HOME_ARCHIVE_OUTPUT].lower()
+    (job2target, job2home) = archive_levels(wcl)
 
-    if miscutils.fwdebug_check(3, "PFWRUNJOB_DEBUG"):
+    if DBG3:
         miscutils.fwdebug_print("job2target = %s" % job2target)
         miscutils.fwdebug_print("job2home = %s" % job2home)
 
     if putinfo:
         # if not end of job and transferring at end of job, save file info for later
         if job2target == 'job' or job2home == 'job':
-            if miscutils.fwdebug_check(3, "PFWRUNJOB_DEBUG"):
+            if DBG3:
                 miscutils.fwdebug_print("Adding %s files to save later" % len(putinfo))
             jobfiles['output_putinfo'].update(putinfo)
 
-    if miscutils.fwdebug_check(3, "PFWRUNJOB_DEBUG"):
+    if DBG3:
         miscutils.fwdebug_print("END\n\n")
 
 
 ######################################################################
-def transfer_job_to_archives(wcl, jobfiles, putinfo, level, task_label, exitcode):
-    """ Call the appropriate transfers based upon which archives job is using """
+def transfer_job_to_archives(wcl, jobfiles, putinfo, level, task_label, exitcode, defer=False):
+    """ Call the appropriate transfers based upon which archives job is using,
+        if defer, the files are left in pending_transfers for the main
+        process to send instead """
     #  level: current calling point: wrapper or job
 
-    if miscutils.fwdebug_check(3, "PFWRUNJOB_DEBUG"):
+    if DBG3:
         miscutils.fwdebug_print("BEG %s %s" % (level, task_label))
         miscutils.fwdebug_print("len(putinfo) = %d" % len(putinfo))
         miscutils.fwdebug_print("putinfo = %s" % putinfo)
 
     level = level.lower()
-    job2target = 'never'
-    if pfwdefs.USE_TARGET_ARCHIVE_OUTPUT in wcl:
-        job2target = wcl[pfwdefs.USE_TARGET_ARCHIVE_OUTPUT].lower()
-    job2home = 'never'
-    if pfwdefs.USE_HOME_ARCHIVE_OUTPUT in wcl:
-        job2home = wcl[pfwdefs.USE_HOME_ARCHIVE_OUTPUT].lower()
-
-    if miscutils.fwdebug_check(3, "PFWRUNJOB_DEBUG"):
+    (job2target, job2home) = archive_levels(wcl)
+
+    if DBG3:
         miscutils.fwdebug_print("job2target = %s" % job2target)
         miscutils.fwdebug_print("job2home = %s" % job2home)
 
@@ -171,36 +295,127 @@ def transfer_job_to_archives(wcl, jobfiles, putinfo, level, task_label, exitcode
             saveinfo = output_transfer_prep(wcl, jobfiles, putinfo,
                                             task_label, exitcode)
 
-        if level == job2target:
-            transfer_job_to_single_archive(wcl, saveinfo, 'target',
-                                           task_label)
-
-        if level == job2home:
-            transfer_job_to_single_archive(wcl, saveinfo, 'home',
-                                           task_label)
+        for (dest, destlevel) in (('target', job2target), ('home', job2home)):
+            if level != destlevel:
+                continue
+            if defer:
+                if saveinfo:
+                    pending_transfers.append((dest, saveinfo, task_label))
+            else:
+                transfer_job_to_single_archive(wcl, saveinfo, dest, task_label)
 
-    if miscutils.fwdebug_check(3, "PFWRUNJOB_DEBUG"):
+    if DBG3:
         miscutils.fwdebug_print("END\n\n")
 
 
+######################################################################
+def take_pending_transfers():
+    """ Remove and return the wrapper outputs waiting to be sent """
+    global pending_transfers
+    pending = pending_transfers
+    pending_transfers = []
+    return pending
+
+
+######################################################################
+def send_wrapper_outputs(wcl, saveinfo, dest, task_label, wrapnum):
+    """ Send a wrapper's outputs to an archive from a transfer thread and
+        report how it went on transfers_done """
+    success = False
+    try:
+        transfer_job_to_single_archive(wcl, saveinfo, dest, task_label)
+        success = True
+    except:
+        traceback.print_exc(file=sys.stdout)
+    finally:
+        transfers_done.put((wrapnum, dest, success))
+
+
+######################################################################
+def start_transfer_pool(width=None):
+    """ Start the threads that send wrapper outputs to the archives, width
+        of them if given, so every wrapper of a group running width at once
+        can be sending its outputs while the others run """
+    global transfer_pool
+    global transfer_width
+    if width is not None and width != transfer_width:
+        stop_transfer_pool()
+        transfer_width = width
+    if transfer_pool is None:
+        transfer_pool = pl.ThreadPool(transfer_width)
+
+
+######################################################################
+def stop_transfer_pool():
+    """ Wait for the transfer threads to send everything they were given,
+        then stop them, so they aren't running when a pool forks """
+    global transfer_pool
+    if transfer_pool is not None:
+        transfer_pool.close()
+        transfer_pool.join()
+        transfer_pool = None
+
+
+######################################################################
+def start_transfers(wcl, transfers, wrapnum):
+    """ Hand a wrapper's outputs to the transfer threads, so they are sent
+        while the next wrappers run """
+    start_transfer_pool()
+    for (dest, saveinfo, task_label) in transfers:
+        transfer_pool.apply_async(send_wrapper_outputs,
+                                  (wcl, saveinfo, dest, task_label, wrapnum))
+
+
+######################################################################
+def finished_transfers(timeout=0):
+    """ Return the (wrapnum, dest, success) of the transfers that ended
+        since the last call, waiting up to timeout seconds for one """
+    finished = []
+    try:
+        finished.append(transfers_done.get(timeout=timeout))
+        while True:
+            finished.append(transfers_done.get_nowait())
+    except queue.Empty:
+        pass
+    for (wrapnum, dest, success) in finished:
+        if not success:
+            print("Error: problems transferring outputs of wrapper %s to %s archive" % \
+                  (wrapnum, dest))
+    return finished
+
+
+######################################################################
+def finish_transfers():
+    """ Wait for the wrapper outputs still being sent at the end of the job,
+        returns False if any of them failed """
+    stop_transfer_pool()
+    wrappers_transferring.clear()
+    return all(success for (_, _, success) in finished_transfers())
+
+
 ######################################################################
 def dynam_load_filemgmt(wcl, archive_info):
     """ Dynamically load filemgmt class """
 
     if archive_info is None:
-        if ((pfwdefs.USE_HOME_ARCHIVE_OUTPUT in wcl and
-             wcl[pfwdefs.USE_HOME_ARCHIVE_OUTPUT].lower() != 'never') or
-                (pfwdefs.USE_HOME_ARCHIVE_INPUT in wcl and
-                 wcl[pfwdefs.USE_HOME_ARCHIVE_INPUT].lower() != 'never')):
+        (target_out, home_out) = archive_levels(wcl)
+        (target_in, home_in) = archive_levels(wcl, 'input')
+        if home_out != 'never' or home_in != 'never':
             archive_info = wcl['home_archive_info']
-        elif ((pfwdefs.USE_TARGET_ARCHIVE_OUTPUT in wcl and
-               wcl[pfwdefs.USE_TARGET_ARCHIVE_OUTPUT].lower() != 'never') or
-              (pfwdefs.USE_TARGET_ARCHIVE_INPUT in wcl and
-               wcl[pfwdefs.USE_HOME_ARCHIVE_INPUT].lower() != 'never')):
+        elif target_out != 'never' or target_in != 'never':
             archive_info = wcl['target_archive_info']
         else:
             raise Exception('Error: Could not determine archive for output files. Check USE_*_ARCHIVE_* WCL vars.')
-    filemgmt = pfwutils.pfw_dynam_load_class(wcl, 'filemgmt', archive_info['filemgmt'], None)
+
+    # reuse the object (and any connection it holds) for the life of the process,
+    # keyed by pid so a forked pool worker never shares its parent's
+    key = (os.getpid(), archive_info['filemgmt'], archive_info['name'])
+    with filemgmt_lock:
+        if key not in filemgmt_cache:
+            filemgmt_cache[key] = pfwutils.pfw_dynam_load_class(wcl, 'filemgmt',
+                                                                archive_info['filemgmt'],
+                                                                None)
+        filemgmt = filemgmt_cache[key]
     return filemgmt
 
 
@@ -217,7 +432,7 @@ def dynam_load_jobfilemvmt(wcl, tstats):
                                         wcl['job_file_mvmt'], tstats, valdict)
     except Exception as err:
         msg = "Error: creating job_file_mvmt object\n%s" % err
-        print "ERROR\n%s" % msg
+        print("ERROR\n%s" % msg)
         raise
 
     return jobfilemvmt
@@ -227,9 +442,9 @@ def dynam_load_jobfilemvmt(wcl, tstats):
 def pfw_save_file_info(filemgmt, ftype, fullnames,
                        do_update, update_info, filepat):
     """ Call and time filemgmt.register_file_data routine for pfw created files """
-    if miscutils.fwdebug_check(3, "PFWRUNJOB_DEBUG"):
+    if DBG3:
         miscutils.fwdebug_print("BEG (%s)" % (ftype))
-    if miscutils.fwdebug_check(3, "PFWRUNJOB_DEBUG"):
+    if DBG3:
         miscutils.fwdebug_print("fullnames=%s" % (fullnames))
         miscutils.fwdebug_print("do_update=%s, update_info=%s" % (do_update, update_info))
 
@@ -242,19 +457,16 @@ def pfw_save_file_info(filemgmt, ftype, fullnames,
         filemgmt.commit()
 
         # if some files failed to register data then the task failed
-        for k, v in res.iteritems():
-            if v is None:
-                listing.append(k)
+        listing = [k for k, v in res.items() if v is None]
 
-        print "DESDMTIME: pfw_save_file_info %0.3f" % (time.time()-starttime)
+        print_desdmtime('pfw_save_file_info', starttime)
     except:
-        (extype, exvalue, trback) = sys.exc_info()
-        traceback.print_exception(extype, exvalue, trback, file=sys.stdout)
+        traceback.print_exc(file=sys.stdout)
 
-        print "DESDMTIME: pfw_save_file_info %0.3f" % (time.time()-starttime)
+        print_desdmtime('pfw_save_file_info', starttime)
         raise
 
-    if miscutils.fwdebug_check(3, "PFWRUNJOB_DEBUG"):
+    if DBG3:
         miscutils.fwdebug_print("END\n\n")
 
     return listing
@@ -262,7 +474,7 @@ def pfw_save_file_info(filemgmt, ftype, fullnames,
 ######################################################################
 def transfer_single_archive_to_job(wcl, files2get, jobfiles, dest):
     """ Handle the transfer of files from a single archive to the job directory """
-    if miscutils.fwdebug_check(3, "PFWRUNJOB_DEBUG"):
+    if DBG3:
         miscutils.fwdebug_print("BEG")
 
     archive_info = wcl['%s_archive_info' % dest.lower()]
@@ -272,13 +484,11 @@ def transfer_single_archive_to_job(wcl, files2get, jobfiles, dest):
                                       archive_info,)
 
     if len(transinfo) != len(files2get):
-        badfiles = []
-        for file_name in files2get:
-            if file_name not in transinfo.keys():
-                badfiles.append(file_name)
-        raise Exception("Error: the following files did not have entries in the database:\n%s" % (", ".join(badfiles)))
+        badfiles = [file_name for file_name in files2get if file_name not in transinfo]
+        raise Exception("Error: the following files did not have entries in the database:\n%s" % \
+                        summarize_files(badfiles))
     if transinfo:
-        if miscutils.fwdebug_check(3, "PFWRUNJOB_DEBUG"):
+        if DBG3:
             miscutils.fwdebug_print("\tCalling target2job on %s files" % len(transinfo))
         starttime = time.time()
         tasktype = '%s2job' % dest
@@ -293,9 +503,9 @@ def transfer_single_archive_to_job(wcl, files2get, jobfiles, dest):
         else:
             res = jobfilemvmt.home2job(transinfo)
 
-    print "DESDMTIME: %s2job %0.3f" % (dest.lower(), time.time()-starttime)
+        print_desdmtime('%s2job' % dest.lower(), starttime)
 
-    if miscutils.fwdebug_check(3, "PFWRUNJOB_DEBUG"):
+    if DBG3:
         miscutils.fwdebug_print("END\n\n")
 
     return res
@@ -307,12 +517,12 @@ def transfer_archives_to_job(wcl, neededfiles):
     """ Call the appropriate transfers based upon which archives job is using """
     # transfer files from target/home archives to job scratch dir
 
-    if miscutils.fwdebug_check(3, "PFWRUNJOB_DEBUG"):
+    if DBG3:
         miscutils.fwdebug_print("BEG")
-    if miscutils.fwdebug_check(6, "PFWRUNJOB_DEBUG"):
+    if DBG6:
         miscutils.fwdebug_print("neededfiles = %s" % neededfiles)
 
-    files2get = neededfiles.keys()
+    files2get = set(neededfiles.keys())
 
     arc = ""
     if 'home_archive' in wcl and 'archive' in wcl:
@@ -325,22 +535,20 @@ def transfer_archives_to_job(wcl, neededfiles):
                                              'target')
 
         if res is not None and res:
-            problemfiles = {}
-            for fkey, finfo in res.items():
-                if 'err' in finfo:
-                    problemfiles[fkey] = finfo
-                    msg = "Warning: Error trying to get file %s from target archive%s: %s" % \
-                          (fkey, arc, finfo['err'])
-                    print msg
-
-            files2get = list(set(files2get) - set(res.keys()))
+            problemfiles = {fkey: finfo for fkey, finfo in res.items() if 'err' in finfo}
+            for fkey, finfo in problemfiles.items():
+                msg = "Warning: Error trying to get file %s from target archive%s: %s" % \
+                      (fkey, arc, finfo['err'])
+                print(msg)
+
+            # files with problems still need to be gotten
+            files2get -= set(res) - set(problemfiles)
             if problemfiles:
-                print "Warning: had problems getting input files from target archive%s" % arc
-                print "\t", problemfiles.keys()
-                files2get += problemfiles.keys()
+                print("Warning: had problems getting input files from target archive%s" % arc)
+                print("\t%s" % summarize_files(problemfiles))
         else:
-            print "Warning: had problems getting input files from target archive%s." % arc
-            print "\ttransfer function returned no results"
+            print("Warning: had problems getting input files from target archive%s." % arc)
+            print("\ttransfer function returned no results")
 
 
     # home archive
@@ -350,24 +558,22 @@ def transfer_archives_to_job(wcl, neededfiles):
                                              'home')
 
         if res is not None and res:
-            problemfiles = {}
-            for fkey, finfo in res.items():
-                if 'err' in finfo:
-                    problemfiles[fkey] = finfo
-                    msg = "Warning: Error trying to get file %s from home archive%s: %s" % \
-                          (fkey, arc, finfo['err'])
-                    print msg
-
-            files2get = list(set(files2get) - set(res.keys()))
+            problemfiles = {fkey: finfo for fkey, finfo in res.items() if 'err' in finfo}
+            for fkey, finfo in problemfiles.items():
+                msg = "Warning: Error trying to get file %s from home archive%s: %s" % \
+                      (fkey, arc, finfo['err'])
+                print(msg)
+
+            # files with problems still need to be gotten
+            files2get -= set(res) - set(problemfiles)
             if problemfiles:
-                print "Warning: had problems getting input files from home archive%s" % arc
-                print "\t", problemfiles.keys()
-                files2get += problemfiles.keys()
+                print("Warning: had problems getting input files from home archive%s" % arc)
+                print("\t%s" % summarize_files(problemfiles))
         else:
-            print "Warning: had problems getting input files from home archive%s." % arc
-            print "\ttransfer function returned no results"
+            print("Warning: had problems getting input files from home archive%s." % arc)
+            print("\ttransfer function returned no results")
 
-    if miscutils.fwdebug_check(3, "PFWRUNJOB_DEBUG"):
+    if DBG3:
         miscutils.fwdebug_print("END\n\n")
     return files2get
 
@@ -377,7 +583,7 @@ def transfer_archives_to_job(wcl, neededfiles):
 ######################################################################
 def get_file_archive_info(wcl, files2get, jobfiles, archive_info):
     """ Get information about files in the archive after creating appropriate filemgmt object """
-    if miscutils.fwdebug_check(3, "PFWRUNJOB_DEBUG"):
+    if DBG3:
         miscutils.fwdebug_print("BEG")
         miscutils.fwdebug_print("archive_info = %s" % archive_info)
 
@@ -389,20 +595,101 @@ def get_file_archive_info(wcl, files2get, jobfiles, archive_info):
                                                       fmdefs.FM_PREFER_UNCOMPRESSED)
 
     if files2get and not fileinfo_archive:
-        print "\tInfo: 0 files found on %s" % archive_info['name']
-        print "\t\tfilemgmt = %s" % archive_info['filemgmt']
+        print("\tInfo: 0 files found on %s" % archive_info['name'])
+        print("\t\tfilemgmt = %s" % archive_info['filemgmt'])
 
-    transinfo = {}
-    for name, info in fileinfo_archive.items():
-        transinfo[name] = copy.deepcopy(info)
-        transinfo[name]['src'] = info['rel_filename']
-        transinfo[name]['dst'] = jobfiles[name]
+    # archive info entries are flat dicts of scalars so a shallow copy is enough
+    transinfo = {name: dict(info, src=info['rel_filename'], dst=jobfiles[name])
+                 for name, info in fileinfo_archive.items()}
 
-    if miscutils.fwdebug_check(3, "PFWRUNJOB_DEBUG"):
+    if DBG3:
         miscutils.fwdebug_print("END\n\n")
     return transinfo
 
 
+######################################################################
+def remove_if_exists(path):
+    """ Unlink path, ignoring it if it is already gone """
+    try:
+        os.unlink(path)
+    except OSError as exc:
+        if exc.errno != errno.ENOENT:
+            raise
+
+
+######################################################################
+def split_filelist(elist):
+    """ miscutils.fwsplit on a comma separated list of file names, without
+        its bracket removal and range expansion when there is nothing for
+        them to act on """
+    if FWSPLIT_SPECIAL.search(elist):
+        return miscutils.fwsplit(elist, ',')
+    return [fname.strip() for fname in elist.split(',')]
+
+
+######################################################################
+def move_file(src, dst):
+    """ Move src to dst, normally the same filesystem so a rename is enough """
+    try:
+        os.rename(src, dst)
+    except OSError as exc:
+        if exc.errno != errno.EXDEV:
+            raise
+        # across filesystems copy as shutil.move would, but through
+        # copyfile_fast instead of its 16 KiB buffer
+        diskutils.copyfile_fast(src, dst)
+        shutil.copystat(src, dst)
+        os.unlink(src)
+
+
+######################################################################
+def makedirs_once(thedir):
+    """ coremakedirs for directories that last the whole job, skipping
+        those this process has already made """
+    if not thedir:
+        return
+    thedir = os.path.abspath(thedir)
+    if thedir not in made_dirs:
+        miscutils.coremakedirs(thedir)
+        made_dirs.add(thedir)
+
+
+######################################################################
+def stat_or_none(path):
+    """ Return os.stat of path, or None if it does not exist """
+    try:
+        return os.stat(path)
+    except (OSError, TypeError):
+        return None
+
+
+######################################################################
+def list_existing_files(fullnames):
+    """ Return the set of the given files that exist on disk, listing a
+        directory holding many of them once instead of checking each one.
+        As with os.path.lexists, a dangling symlink counts as existing """
+    # file names are compared normalised, so e.g. ./x and x match
+    bydir = {}
+    for fname in set(fullnames):
+        (dirname, name) = os.path.split(os.path.normpath(fname))
+        bydir.setdefault(dirname, {}).setdefault(name, []).append(fname)
+
+    present = set()
+    for (dirname, wanted) in bydir.items():
+        if len(wanted) < LIST_DIR_MIN_FILES:
+            found = [name for name in wanted if os.path.lexists(os.path.join(dirname, name))]
+        else:
+            try:
+                found = set(wanted).intersection(os.listdir(dirname or '.'))
+            except OSError as exc:
+                if exc.errno not in (errno.ENOENT, errno.ENOTDIR):
+                    raise
+                found = []
+        for name in found:
+            present.update(wanted[name])
+    return present
+
+
 ######################################################################
 def get_wrapper_inputs(wcl, infiles):
     """ Transfer any inputs needed for this wrapper """
@@ -413,47 +700,45 @@ def get_wrapper_inputs(wcl, infiles):
     # check which input files are already in job scratch directory
     #    (i.e., outputs from a previous execution)
     if not infiles:
-        print "\tInfo: 0 inputs needed for wrapper"
+        print("\tInfo: 0 inputs needed for wrapper")
         return
 
-    for isect in infiles:
-        exists, missing = intgmisc.check_files(infiles[isect])
-
-        for efile in exists:
-            existinginputs[miscutils.parse_fullname(efile, miscutils.CU_PARSE_FILENAME)] = efile
-
-        for mfile in missing:
-            missinginputs[miscutils.parse_fullname(mfile, miscutils.CU_PARSE_FILENAME)] = mfile
+    allinputs = [ifile for isect in infiles for ifile in infiles[isect]]
+    present = list_existing_files(allinputs)
+    for ifile in allinputs:
+        fname = miscutils.parse_fullname(ifile, miscutils.CU_PARSE_FILENAME)
+        if ifile in present:
+            existinginputs[fname] = ifile
+        else:
+            missinginputs[fname] = ifile
 
     if missinginputs:
-        if miscutils.fwdebug_check(9, "PFWRUNJOB_DEBUG"):
+        if DBG9:
             miscutils.fwdebug_print("missing inputs: %s" % missinginputs)
 
         files2get = transfer_archives_to_job(wcl, missinginputs)
 
         # check if still missing input files
         if files2get:
-            print '!' * 60
+            print('!' * 60)
             for fname in files2get:
                 msg = "Error: input file needed that was not retrieved from target or home archives\n(%s)" % fname
-                print msg
+                print(msg)
             raise Exception("Error:  Cannot find all input files in an archive")
 
         # double-check: check that files are now on filesystem
         errcnt = 0
-        for sect in infiles:
-            _, missing = intgmisc.check_files(infiles[sect])
-
-            if missing:
-                for mfile in missing:
-                    msg = "Error: input file doesn't exist despite transfer success (%s)" % mfile
-                    print msg
-                    errcnt += 1
+        present = list_existing_files(missinginputs.values())
+        for mfile in missinginputs.values():
+            if mfile not in present:
+                msg = "Error: input file doesn't exist despite transfer success (%s)" % mfile
+                print(msg)
+                errcnt += 1
         if errcnt > 0:
             raise Exception("Error:  Cannot find all input files after transfer.")
     else:
-        print "\tInfo: all %s input file(s) already in job directory." % \
-              len(existinginputs)
+        print("\tInfo: all %s input file(s) already in job directory." % \
+              len(existinginputs))
 
 
 
@@ -464,11 +749,11 @@ def get_exec_names(wcl):
     execnamesarr = []
     exec_sectnames = intgmisc.get_exec_sections(wcl, pfwdefs.IW_EXECPREFIX)
     for sect in sorted(exec_sectnames):
-        if miscutils.fwdebug_check(3, "PFWRUNJOB_DEBUG"):
+        if DBG3:
             miscutils.fwdebug_print("section %s" % sect)
         if 'execname' not in wcl[sect]:
-            print "Error: Missing execname in input wcl.  sect =", sect
-            print "wcl[sect] = ", miscutils.pretty_print_dict(wcl[sect])
+            print("Error: Missing execname in input wcl.  sect =", sect)
+            print("wcl[sect] = ", miscutils.pretty_print_dict(wcl[sect]))
             miscutils.fwdie("Error: Missing execname in input wcl", pfwdefs.PF_EXIT_FAILURE)
 
         execnamesarr.append(wcl[sect]['execname'])
@@ -480,13 +765,13 @@ def get_exec_names(wcl):
 def create_exec_tasks(wcl):
     """ Create exec tasks saving task_ids in wcl """
 
-    wcl['task_id']['exec'] = OrderedDict()
+    wcl['task_id']['exec'] = {}
 
     exec_sectnames = intgmisc.get_exec_sections(wcl, pfwdefs.IW_EXECPREFIX)
     for sect in sorted(exec_sectnames):
         # make sure execnum in the exec section in wcl for the insert_exec function
         if 'execnum' not in wcl[sect]:
-            result = re.match(r'%s(\d+)' % pfwdefs.IW_EXECPREFIX, sect)
+            result = EXECNUM_RE.match(sect)
             if not result:
                 miscutils.fwdie("Error:  Cannot determine execnum for input wcl sect %s" % \
                                 sect, pfwdefs.PF_EXIT_FAILURE)
@@ -508,15 +793,17 @@ def setup_working_dir(workdir, files, jobroot):
     miscutils.coremakedirs(workdir)
     os.chdir(workdir)
 
-    # create symbolic links for input files
-    for isect in files:
-        for ifile in files[isect]:
-            # make subdir inside fw thread working dir so match structure of job scratch
-            subdir = os.path.dirname(ifile)
-            if subdir != "":
-                miscutils.coremakedirs(subdir)
+    # the same input may be listed in more than one section
+    infiles = {ifile for isect in files for ifile in files[isect]}
+
+    # make subdirs inside fw thread working dir so match structure of job scratch
+    for subdir in {os.path.dirname(ifile) for ifile in infiles}:
+        if subdir != "":
+            miscutils.coremakedirs(subdir)
 
-            os.symlink(os.path.join(jobroot, ifile), ifile)
+    # create symbolic links for input files
+    for ifile in infiles:
+        os.symlink(os.path.join(jobroot, ifile), ifile)
 
     os.symlink("../inputwcl", "inputwcl")
     os.symlink("../log", "log")
@@ -528,7 +815,7 @@ def setup_working_dir(workdir, files, jobroot):
 def setup_wrapper(wcl, logfilename, workdir, ins):
     """ Create output directories, get files from archive, and other setup work """
 
-    if miscutils.fwdebug_check(3, "PFWRUNJOB_DEBUG"):
+    if DBG3:
         miscutils.fwdebug_print("BEG")
 
     if workdir is not None:
@@ -539,7 +826,7 @@ def setup_wrapper(wcl, logfilename, workdir, ins):
 
     # make directory for log file
     logdir = os.path.dirname(logfilename)
-    miscutils.coremakedirs(logdir)
+    makedirs_once(logdir)
 
     # get execnames to put on command line for QC Framework
     wcl['execnames'] = wcl['wrapper']['wrappername'] + ',' + get_exec_names(wcl)
@@ -552,20 +839,20 @@ def setup_wrapper(wcl, logfilename, workdir, ins):
     if workdir is not None:
         setup_working_dir(workdir, ins, os.getcwd())
 
-    if miscutils.fwdebug_check(3, "PFWRUNJOB_DEBUG"):
+    if DBG3:
         miscutils.fwdebug_print("END\n\n")
 
 ######################################################################
 def compose_path(dirpat, wcl, infdict):
     """ Create path by replacing variables in given directory pattern """
 
-    if miscutils.fwdebug_check(3, "PFWRUNJOB_DEBUG"):
+    if DBG3:
         miscutils.fwdebug_print("BEG")
 
     dirpat2 = replfuncs.replace_vars(dirpat, wcl, {'searchobj': infdict,
                                                    'required': True,
                                                    intgdefs.REPLACE_VARS: True})
-    if miscutils.fwdebug_check(3, "PFWRUNJOB_DEBUG"):
+    if DBG3:
         miscutils.fwdebug_print("END\n\n")
     return dirpat2
 
@@ -575,20 +862,20 @@ def output_transfer_prep(wcl, jobfiles, putinfo, task_label, exitcode):
 
     mastersave = wcl.get(pfwdefs.MASTER_SAVE_FILE).lower()
     mastercompress = wcl.get(pfwdefs.MASTER_COMPRESSION)
-    if miscutils.fwdebug_check(3, "PFWRUNJOB_DEBUG"):
+    if DBG3:
         miscutils.fwdebug_print("%s: mastersave = %s" % (task_label, mastersave))
         miscutils.fwdebug_print("%s: mastercompress = %s" % (task_label, mastercompress))
 
     # make archive rel paths for transfer
     saveinfo = {}
     for key, fdict in putinfo.items():
-        if miscutils.fwdebug_check(3, "PFWRUNJOB_DEBUG"):
+        if DBG3:
             miscutils.fwdebug_print("putinfo[%s] = %s" % (key, fdict))
         should_save = pfwutils.should_save_file(mastersave, fdict['filesave'], exitcode)
         if should_save:
             if 'path' not in fdict:
                 miscutils.fwdebug_print("Error: Missing path (archivepath) in file definition")
-                print key, fdict
+                print(key, fdict)
                 sys.exit(1)
             should_compress = pfwutils.should_compress_file(mastercompress,
                                                             fdict['filecompress'],
@@ -598,7 +885,7 @@ def output_transfer_prep(wcl, jobfiles, putinfo, task_label, exitcode):
             saveinfo[key] = fdict
 
     call_compress_files(wcl, jobfiles, saveinfo)
-    if miscutils.fwdebug_check(3, "PFWRUNJOB_DEBUG"):
+    if DBG3:
         miscutils.fwdebug_print("After compress saveinfo = %s" % (saveinfo))
 
     return saveinfo
@@ -608,7 +895,7 @@ def output_transfer_prep(wcl, jobfiles, putinfo, task_label, exitcode):
 def transfer_job_to_single_archive(wcl, saveinfo, dest, task_label):
     """ Handle the transfer of files from the job directory to a single archive """
 
-    if miscutils.fwdebug_check(3, "PFWRUNJOB_DEBUG"):
+    if DBG3:
         miscutils.fwdebug_print("TRANSFER JOB TO ARCHIVE SECTION")
     archive_info = wcl['%s_archive_info' % dest.lower()]
     tstats = None
@@ -642,26 +929,27 @@ def transfer_job_to_single_archive(wcl, saveinfo, dest, task_label):
             problemfiles[fkey] = finfo
             msg = "Warning: Error trying to copy file %s to %s archive%s: %s" % \
                    (fkey, dest, arc, finfo['err'])
-            print msg
+            print(msg)
 
     if problemfiles:
-        print "ERROR\n\n\nError: putting %d files into archive %s" % \
-              (len(problemfiles), archive_info['name'])
-        print "\t", problemfiles.keys()
+        print("ERROR\n\n\nError: putting %d files into archive %s" % \
+              (len(problemfiles), archive_info['name']))
+        print("\t%s" % summarize_files(problemfiles))
         raise Exception("Error: problems putting %d files into archive %s" %
                         (len(problemfiles), archive_info['name']))
 
 
 ######################################################################
 def save_log_file(filemgmt, wcl, jobfiles, logfile):
-    """ Register log file and prepare for copy to archive """
+    """ Register log file and prepare for copy to archive, callers pass
+        None for logfile unless it is an existing file """
 
-    if miscutils.fwdebug_check(3, "PFWRUNJOB_DEBUG"):
+    if DBG3:
         miscutils.fwdebug_print("BEG")
 
     putinfo = {}
-    if logfile is not None and os.path.isfile(logfile):
-        if miscutils.fwdebug_check(3, "PFWRUNJOB_DEBUG"):
+    if logfile is not None:
+        if DBG3:
             miscutils.fwdebug_print("log exists (%s)" % logfile)
 
         filepat = wcl['filename_pattern']['log']
@@ -671,8 +959,7 @@ def save_log_file(filemgmt, wcl, jobfiles, logfile):
             pfw_save_file_info(filemgmt, 'log', [logfile],
                                False, None, filepat)
         except:
-            (extype, exvalue, trback) = sys.exc_info()
-            traceback.print_exception(extype, exvalue, trback, file=sys.stdout)
+            traceback.print_exc(file=sys.stdout)
 
         # since able to register log file, save as not junk file
         jobfiles['outfullnames'].append(logfile)
@@ -694,21 +981,22 @@ def save_log_file(filemgmt, wcl, jobfiles, logfile):
 
 
 ######################################################################
-def copy_output_to_archive(wcl, jobfiles, fileinfo, level, task_label, exitcode):
-    """ If requested, copy output file(s) to archive """
+def copy_output_to_archive(wcl, jobfiles, fileinfo, level, task_label, exitcode, defer=False):
+    """ If requested, copy output file(s) to archive, see transfer_job_to_archives
+        for defer """
     # fileinfo[filename] = {filename, fullname, sectname}
 
-    if miscutils.fwdebug_check(3, "PFWRUNJOB_DEBUG"):
+    if DBG3:
         miscutils.fwdebug_print("BEG")
     putinfo = {}
 
 
     # check each output file definition to see if should save file
-    if miscutils.fwdebug_check(3, "PFWRUNJOB_DEBUG"):
+    if DBG3:
         miscutils.fwdebug_print("Checking for save_file_archive")
 
     for (filename, fdict) in fileinfo.items():
-        if miscutils.fwdebug_check(3, "PFWRUNJOB_DEBUG"):
+        if DBG3:
             miscutils.fwdebug_print("filename %s, fdict=%s" % (filename, fdict))
         (filename, compression) = miscutils.parse_fullname(fdict['fullname'],
                                                            miscutils.CU_PARSE_FILENAME|miscutils.CU_PARSE_COMPRESSION)
@@ -721,9 +1009,9 @@ def copy_output_to_archive(wcl, jobfiles, fileinfo, level, task_label, exitcode)
                              'filecompress': fdict['filecompress'],
                              'path': fdict['path']}
 
-    transfer_job_to_archives(wcl, jobfiles, putinfo, level, task_label, exitcode)
+    transfer_job_to_archives(wcl, jobfiles, putinfo, level, task_label, exitcode, defer)
 
-    if miscutils.fwdebug_check(3, "PFWRUNJOB_DEBUG"):
+    if DBG3:
         miscutils.fwdebug_print("END\n\n")
 
 
@@ -746,50 +1034,46 @@ def cleanup_dir(dirname, removeRoot=False):
     if not os.path.isdir(dirname):
         return
 
-    # remove empty subfolders
-    files = os.listdir(dirname)
-    if files > 0:
-        for f in files:
-            fullpath = os.path.join(dirname, f)
-            if os.path.isdir(fullpath):
-                cleanup_dir(fullpath, True)
-
-    # if folder empty, delete it
-    files = os.listdir(dirname)
-    if files == 0 and removeRoot:
+    # walk bottom-up so subfolders are removed before their parent is tried,
+    # rmdir itself refuses any folder that is not empty
+    for (dirpath, _, _) in os.walk(dirname, topdown=False):
+        if dirpath == dirname and not removeRoot:
+            continue
         try:
-            os.rmdir(dirname)
-        except:
+            os.rmdir(dirpath)
+        except OSError:
             pass
 
 
 ######################################################################
 def post_wrapper(wcl, ins, jobfiles, logfile, exitcode, workdir):
     """ Execute tasks after a wrapper is done """
-    if miscutils.fwdebug_check(3, "PFWRUNJOB_DEBUG"):
+    if DBG3:
         miscutils.fwdebug_print("BEG")
     #logfile = None
     # Save disk usage for wrapper execution
+    outputwclfile = wcl[pfwdefs.IW_WRAPSECT]['outputwcl']
+    outputwclstat = stat_or_none(outputwclfile)
+    logstat = stat_or_none(logfile)
     disku = 0
     if workdir is not None:
         disku = pfwutils.diskusage(os.getcwd())
 
         # outputwcl and log are softlinks skipped by diskusage command
         # so add them individually
-        if os.path.exists(wcl[pfwdefs.IW_WRAPSECT]['outputwcl']):
-            disku += os.path.getsize(wcl[pfwdefs.IW_WRAPSECT]['outputwcl'])
-        if os.path.exists(logfile):
-            disku += os.path.getsize(logfile)
+        if outputwclstat is not None:
+            disku += outputwclstat.st_size
+        if logstat is not None:
+            disku += logstat.st_size
     else:
         disku = pfwutils.diskusage(wcl['jobroot'])
     wcl['wrap_usage'] = disku - wcl['pre_disk_usage']
 
     # don't save logfile name if none was actually written
-    if not os.path.isfile(logfile):
+    if logstat is None or not stat.S_ISREG(logstat.st_mode):
         logfile = None
 
-    outputwclfile = wcl[pfwdefs.IW_WRAPSECT]['outputwcl']
-    if not os.path.exists(outputwclfile):
+    if outputwclstat is None:
         outputwclfile = None
 
     filemgmt = dynam_load_filemgmt(wcl, None)
@@ -804,7 +1088,7 @@ def post_wrapper(wcl, ins, jobfiles, logfile, exitcode, workdir):
         finfo.update(logfinfo)
 
     outputwcl = WCL()
-    if outputwclfile and os.path.exists(outputwclfile):
+    if outputwclfile:
         with open(outputwclfile, 'r') as outwclfh:
             outputwcl.read(outwclfh, filename=outputwclfile)
 
@@ -815,9 +1099,8 @@ def post_wrapper(wcl, ins, jobfiles, logfile, exitcode, workdir):
         if workdir is not None:
 
             # undo symbolic links to input files
-            for sect in ins:
-                for fname in ins[sect]:
-                    os.unlink(fname)
+            for fname in {ifile for sect in ins for ifile in ins[sect]}:
+                remove_if_exists(fname)
 
             #jobroot = os.getcwd()[:os.getcwd().find(workdir)]
             jobroot = wcl['jobroot']
@@ -826,24 +1109,26 @@ def post_wrapper(wcl, ins, jobfiles, logfile, exitcode, workdir):
             if outputwcl is not None and outputwcl and \
                pfwdefs.OW_OUTPUTS_BY_SECT in outputwcl and \
                outputwcl[pfwdefs.OW_OUTPUTS_BY_SECT]:
+                moves = {}
+                subdirs = set()
                 for byexec in outputwcl[pfwdefs.OW_OUTPUTS_BY_SECT].values():
                     for elist in byexec.values():
-                        files = miscutils.fwsplit(elist, ',')
-                        for _file in files:
+                        for _file in split_filelist(elist):
                             subdir = os.path.dirname(_file)
                             if subdir != "":
-                                newdir = os.path.join(jobroot, subdir)
-                                miscutils.coremakedirs(newdir)
+                                subdirs.add(subdir)
+                            moves[_file] = os.path.join(jobroot, _file)
 
-                            # move file from fw thread working dir to job scratch dir
-                            shutil.move(_file, os.path.join(jobroot, _file))
+                for subdir in subdirs:
+                    makedirs_once(os.path.join(jobroot, subdir))
+
+                # move files from fw thread working dir to job scratch dir
+                for (src, dst) in moves.items():
+                    move_file(src, dst)
 
             # undo symbolic links to log and outputwcl dirs
-            os.unlink('log')
-            os.unlink('outputwcl')
-            os.unlink('inputwcl')
-            if os.path.exists('list'):
-                os.unlink('list')
+            for linkname in ('log', 'outputwcl', 'inputwcl', 'list'):
+                remove_if_exists(linkname)
 
             os.chdir(jobroot)    # change back to job scratch directory from fw thread working dir
             cleanup_dir(workdir, True)
@@ -853,71 +1138,69 @@ def post_wrapper(wcl, ins, jobfiles, logfile, exitcode, workdir):
             pfw_hdrupd = get_pfw_hdrupd(wcl)
             execs = intgmisc.get_exec_sections(outputwcl, pfwdefs.OW_EXECPREFIX)
             for sect in execs:
-                print "DESDMTIME: app_exec %s %0.3f" % (sect, float(outputwcl[sect]['walltime']))
+                print("DESDMTIME: app_exec %s %0.3f" % (sect, float(outputwcl[sect]['walltime'])))
 
             if pfwdefs.OW_OUTPUTS_BY_SECT in outputwcl and \
                outputwcl[pfwdefs.OW_OUTPUTS_BY_SECT]:
-                badfiles = []
-                wrap_output_files = []
+                badfiles = set()
+                # dict keys keep the outputs unique and in the order listed
+                wrap_output_files = {}
                 for sectname, byexec in outputwcl[pfwdefs.OW_OUTPUTS_BY_SECT].items():
                     sectkeys = sectname.split('.')
                     sectdict = wcl.get('%s.%s' % (pfwdefs.IW_FILESECT, sectkeys[-1]))
                     filesave = miscutils.checkTrue(pfwdefs.SAVE_FILE_ARCHIVE, sectdict, True)
                     filecompress = miscutils.checkTrue(pfwdefs.COMPRESS_FILES, sectdict, False)
 
-                    updatedef = {}
                     # get any hdrupd secton from inputwcl
-                    for key, val in sectdict.items():
-                        if key.startswith('hdrupd'):
-                            updatedef[key] = val
+                    updatedef = {key: val for key, val in sectdict.items()
+                                 if key.startswith('hdrupd')}
 
                     # add pfw hdrupd values
                     updatedef['hdrupd_pfw'] = pfw_hdrupd
-                    if miscutils.fwdebug_check(3, "PFWRUNJOB_DEBUG"):
+                    if DBG3:
                         miscutils.fwdebug_print("sectname %s, updatedef=%s" % \
                                                 (sectname, updatedef))
 
-                    for _, elist in byexec.items():
-                        fullnames = miscutils.fwsplit(elist, ',')
-                        wrap_output_files.extend(fullnames)
-                        filepat = None
-                        if 'filepat' in sectdict:
-                            if sectdict['filepat'] in wcl['filename_pattern']:
-                                filepat = wcl['filename_pattern'][sectdict['filepat']]
-                            else:
-                                raise KeyError('Missing file pattern (%s, %s, %s)' % (sectname,
-                                                                                      sectdict['filetype'],
-                                                                                      sectdict['filepat']))
+                    filetype = sectdict['filetype']
+                    archivepath = sectdict.get('archivepath')
+                    filepat = None
+                    if 'filepat' in sectdict:
+                        if sectdict['filepat'] in wcl['filename_pattern']:
+                            filepat = wcl['filename_pattern'][sectdict['filepat']]
+                        else:
+                            raise KeyError('Missing file pattern (%s, %s, %s)' % (sectname,
+                                                                                  filetype,
+                                                                                  sectdict['filepat']))
+
+                    for elist in byexec.values():
+                        fullnames = split_filelist(elist)
+                        wrap_output_files.update(dict.fromkeys(fullnames))
                         try:
-                            badfiles.extend(pfw_save_file_info(filemgmt, sectdict['filetype'],
+                            badfiles.update(pfw_save_file_info(filemgmt, filetype,
                                                                fullnames, True, updatedef, filepat))
-                        except Exception, e:
+                        except Exception as e:
                             miscutils.fwdebug_print('An error occurred')
-                            (extype, exvalue, trback) = sys.exc_info()
-                            traceback.print_exception(extype, exvalue, trback, file=sys.stdout)
+                            traceback.print_exc(file=sys.stdout)
                             excepts.append(e)
                         for fname in fullnames:
                             if fname in badfiles:
                                 continue
                             finfo[fname] = {'sectname': sectname,
-                                            'filetype': sectdict['filetype'],
+                                            'filetype': filetype,
                                             'filesave': filesave,
                                             'filecompress': filecompress,
                                             'fullname': fname}
-                            if 'archivepath' in sectdict:
-                                finfo[fname]['path'] = sectdict['archivepath']
+                            if archivepath is not None:
+                                finfo[fname]['path'] = archivepath
 
-                wrap_output_files = list(set(wrap_output_files))
                 if badfiles:
+                    badlist = summarize_files(sorted(badfiles))
                     miscutils.fwdebug_print("An error occured during metadata ingestion the following file(s) had issues: %s" % \
-', '.join(badfiles))
-                    (extype, exvalue, trback) = sys.exc_info()
-                    traceback.print_exception(extype, exvalue, trback, file=sys.stdout)
+badlist)
 
-                    excepts.append(Exception("An error occured during metadata ingestion the following file(s) had issues: %s" % ', '.join(badfiles)))
-                    for f in badfiles:
-                        if f in wrap_output_files:
-                            wrap_output_files.remove(f)
+                    excepts.append(Exception("An error occured during metadata ingestion the following file(s) had issues: %s" % badlist))
+                    for fname in badfiles:
+                        wrap_output_files.pop(fname, None)
 
                 jobfiles['outfullnames'].extend(wrap_output_files)
                 # update input files
@@ -927,11 +1210,12 @@ def post_wrapper(wcl, ins, jobfiles, logfile, exitcode, workdir):
 
     if finfo:
         save_trans_end_of_job(wcl, jobfiles, finfo)
-        copy_output_to_archive(wcl, jobfiles, finfo, 'wrapper', 'wrapper_output', exitcode)
+        copy_output_to_archive(wcl, jobfiles, finfo, 'wrapper', 'wrapper_output', exitcode,
+                               defer=True)
 
     # clean up any input files no longer needed - TODO
 
-    if miscutils.fwdebug_check(3, "PFWRUNJOB_DEBUG"):
+    if DBG3:
         miscutils.fwdebug_print("END\n\n")
     if excepts:
         raise Exception('An exception was raised. See tracebacks further up the output for information.')
@@ -950,31 +1234,127 @@ def parse_wrapper_line(line, linecnt):
         (wrapinfo['wrapnum'], wrapinfo['wrapname'], wrapinfo['wclfile'], wrapinfo['logfile']) = lineparts
         wrapinfo['wrapdebug'] = 0  # default wrapdebug
     else:
-        print "Error: incorrect number of items in line #%s" % linecnt
-        print "       Check that modnamepat matches wrapperloop"
-        print "\tline: %s" % line
+        print("Error: incorrect number of items in line #%s" % linecnt)
+        print("       Check that modnamepat matches wrapperloop")
+        print("\tline: %s" % line)
         raise SyntaxError("Error: incorrect number of items in line #%s" % linecnt)
     #wrapinfo['logfile'] = None
     return wrapinfo
 
 
+######################################################################
+def walk_files(path):
+    """ Yield the paths of the files under path, skipping any directory
+        that can't be read """
+    # os.walk reads each directory with scandir where python has it, so the
+    # file types come from the listing without a stat per entry
+    for (dirpath, _, filenames) in os.walk(path):
+        for fname in filenames:
+            yield os.path.join(dirpath, fname)
+
+
+######################################################################
+def scan_dir(path):
+    """ Return (files, subdirs) directly in path, subdirs being the ones
+        walk_files would descend into, or nothing if path can't be read """
+    # only the first step of os.walk, so only path itself is read
+    for (_, dirnames, filenames) in os.walk(path):
+        subdirs = [os.path.join(path, dname) for dname in dirnames]
+        # like os.walk, list but don't descend into symlinked dirs
+        return ([os.path.join(path, fname) for fname in filenames],
+                [subdir for subdir in subdirs if not os.path.islink(subdir)])
+    return ([], [])
+
+
+######################################################################
+def walk_files_threaded(path):
+    """ Return what walk_files(path) yields, sorted, reading every directory
+        as its own task so directory reads at all depths overlap on slow
+        filesystems """
+    files = []
+    tpool = pl.ThreadPool(WALK_THREADS)
+    try:
+        # results are taken in the order the directories were found, the
+        # tasks behind the one being waited on keep running meanwhile
+        pending = collections.deque([(path, tpool.apply_async(scan_dir, (path,)))])
+        while pending:
+            (dirname, task) = pending.popleft()
+            try:
+                (found, subdirs) = task.get()
+            except Exception:
+                # a directory that can't be listed shouldn't cost the whole job
+                print("Warning: could not read %s, skipping it" % dirname)
+                traceback.print_exc(limit=1, file=sys.stdout)
+                continue
+            files.extend(found)
+            pending.extend((subdir, tpool.apply_async(scan_dir, (subdir,)))
+                           for subdir in subdirs)
+    finally:
+        tpool.terminate()
+    # the tasks finish in whatever order the filesystem answers
+    files.sort()
+    return files
+
+
 ######################################################################
 def gather_initial_fullnames():
     """ save fullnames for files initially in job scratch directory
         so won't appear in junk tarball """
 
-    infullnames = []
-    for (dirpath, _, filenames) in os.walk('.'):
-        dpath = dirpath[2:]
-        if dpath:
-            dpath += '/'
-        for fname in filenames:
-            infullnames.append('%s%s' % (dpath, fname))
+    infullnames = [fname[2:] for fname in walk_files('.')]
 
-    if miscutils.fwdebug_check(6, 'PFWRUNJOB_DEBUG'):
+    if DBG6:
         miscutils.fwdebug_print("initial infullnames=%s" % infullnames)
     return infullnames
 
+######################################################################
+def human_size(nbytes):
+    """ Format a byte count the way df -h does """
+    size = float(nbytes)
+    for unit in 'BKMGTP':
+        if size < 1024 or unit == 'P':
+            break
+        size /= 1024
+    if unit == 'B':
+        return "%d" % size
+    if size < 10:
+        return "%.1f%s" % (size, unit)
+    return "%.0f%s" % (size, unit)
+
+######################################################################
+def memory_status():
+    """ Return a free -m style table of memory usage read from /proc/meminfo """
+    meminfo = {}
+    with open('/proc/meminfo', 'r') as memfh:
+        for line in memfh:
+            (key, val) = line.split(':', 1)
+            meminfo[key] = int(val.split()[0]) // 1024    # kB to MB
+
+    buffcache = meminfo['Buffers'] + meminfo['Cached'] + meminfo.get('SReclaimable', 0)
+    # older kernels don't report MemAvailable
+    avail = meminfo.get('MemAvailable', meminfo['MemFree'] + buffcache)
+    header = ('', 'total', 'used', 'free', 'shared', 'buff/cache', 'available')
+    mem = ('Mem:', meminfo['MemTotal'], meminfo['MemTotal'] - avail, meminfo['MemFree'],
+           meminfo.get('Shmem', 0), buffcache, avail)
+    swap = ('Swap:', meminfo['SwapTotal'], meminfo['SwapTotal'] - meminfo['SwapFree'],
+            meminfo['SwapFree'])
+    return "%-7s%12s%12s%12s%12s%12s%12s\n" % header + \
+           "%-7s%12d%12d%12d%12d%12d%12d\n" % mem + \
+           "%-7s%12d%12d%12d\n" % swap
+
+######################################################################
+def disk_status(path):
+    """ Return a df -h style line of disk usage for the filesystem holding path """
+    vfs = os.statvfs(path)
+    total = vfs.f_blocks * vfs.f_frsize
+    used = (vfs.f_blocks - vfs.f_bfree) * vfs.f_frsize
+    avail = vfs.f_bavail * vfs.f_frsize
+    # df rounds the percentage up and computes it against used+avail
+    pct = -(-used * 100 // (used + avail)) if used + avail else 0
+    return "%6s%6s%6s%5s  %s\n" % ('Size', 'Used', 'Avail', 'Use%', 'Path') + \
+           "%6s%6s%6s%4d%%  %s\n" % (human_size(total), human_size(used),
+                                      human_size(avail), pct, path)
+
 ######################################################################
 def exechost_status():
     """ Print various information about exec host """
@@ -983,26 +1363,102 @@ def exechost_status():
 
     # free
     try:
-        subp = subprocess.Popen(["free", "-m"], stdout=subprocess.PIPE)
-        output = subp.communicate()[0]
-        print "EXECSTAT %s FREE\n%s" % (exechost, output)
+        try:
+            output = memory_status()
+        except OSError:
+            # no /proc/meminfo, fall back to the free command
+            output = subprocess.check_output(["free", "-m"], universal_newlines=True)
+        print("EXECSTAT %s FREE\n%s" % (exechost, output))
     except:
-        print "Problem running free command"
-        (extype, exvalue, trback) = sys.exc_info()
-        traceback.print_exception(extype, exvalue, trback, limit=1, file=sys.stdout)
-        print "Ignoring error and continuing...\n"
+        print("Problem running free command")
+        traceback.print_exc(limit=1, file=sys.stdout)
+        print("Ignoring error and continuing...\n")
 
     # df
     try:
-        cwd = os.getcwd()
-        subp = subprocess.Popen(["df", "-h", cwd], stdout=subprocess.PIPE)
-        output = subp.communicate()[0]
-        print "EXECSTAT %s DF\n%s" % (exechost, output)
+        output = disk_status(os.getcwd())
+        print("EXECSTAT %s DF\n%s" % (exechost, output))
     except:
-        print "Problem running df command"
-        (extype, exvalue, trback) = sys.exc_info()
-        traceback.print_exception(extype, exvalue, trback, limit=1, file=sys.stdout)
-        print "Ignoring error and continuing...\n"
+        print("Problem running df command")
+        traceback.print_exc(limit=1, file=sys.stdout)
+        print("Ignoring error and continuing...\n")
+
+######################################################################
+def init_worker(jwcl, queues, slotcnt):
+    """ Save the job-level values shared by every task run in a pool worker
+        and claim this worker's own pair of log queues
+    """
+    global jobwcl
+    global worker_queues
+    global pool_width
+    jobwcl = jwcl
+    # there is a pair of log queues per worker in the pool
+    pool_width = len(queues)
+    with slotcnt.get_lock():
+        slot = slotcnt.value
+        slotcnt.value += 1
+    worker_queues = queues[slot % len(queues)]
+
+######################################################################
+def drain_log_queue(logq, writer):
+    """ Pass messages from a single worker's log queue to writer until the
+        None sentinel is received
+    """
+    while True:
+        try:
+            msg = logq.get(timeout=LOGQ_TIMEOUT)
+        except queue.Empty:
+            continue
+        except (EOFError, OSError):
+            break
+        if msg is None:
+            break
+        writer(msg)
+
+######################################################################
+def start_log_readers(nslots):
+    """ Create an (stdout, stderr) queue pair per worker slot, each drained
+        by its own thread, so workers never contend for a log queue
+    """
+    global log_queues
+    global log_readers
+    log_queues = [(LogQueue(), LogQueue()) for _ in range(nslots)]
+    log_readers = []
+    for (outq, errq) in log_queues:
+        for (logq, writer) in ((outq, print), (errq, sys.stderr.write)):
+            reader = threading.Thread(target=drain_log_queue, args=(logq, writer))
+            reader.daemon = True
+            reader.start()
+            log_readers.append(reader)
+    return log_queues
+
+######################################################################
+def stop_log_readers():
+    """ Stop the log reader threads after they print anything still queued """
+    global log_queues
+    global log_readers
+    for (outq, errq) in log_queues:
+        for logq in (outq, errq):
+            # a worker killed mid-write may hold the queue lock
+            if terminating:
+                logq.cancel_join_thread()
+            logq.put(None)
+    for reader in log_readers:
+        reader.join(60)
+    log_queues = []
+    log_readers = []
+
+######################################################################
+def close_pool():
+    """ Shut down the persistent worker pool once all task groups are done """
+    global pool
+    if pool is not None:
+        # a terminated pool has already been torn down by hand
+        if not terminating:
+            pool.close()
+            pool.join()
+        pool = None
+    stop_log_readers()
 
 ######################################################################
 def job_thread(argv):
@@ -1020,9 +1476,17 @@ def job_thread(argv):
         wcl['wrap_usage'] = 0.0
         jobfiles = {}
         task = {'wrapnum':'-1'}
+        startdir = os.getcwd()
         try:
-            # break up the input data
-            (task, jobfiles, jwcl, ins, outq, errq, multi) = argv
+            # break up the input data, the wrapper's wcl was already read and
+            # merged with the job-level values by job_workflow
+            (task, jobfiles, ins, wcl, multi) = argv
+            if 'wrap_usage' not in wcl:
+                wcl['wrap_usage'] = 0.0
+            if multi:
+                (outq, errq) = worker_queues
+            else:
+                (outq, errq) = (sys.stdout, sys.stderr)
             stdp = WrapOutput(task['wrapnum'], outq)
             stdporig = sys.stdout
             sys.stdout = stdp
@@ -1035,14 +1499,6 @@ def job_thread(argv):
 
             wrappercmd = "%s %s" % (task['wrapname'], task['wclfile'])
 
-            if not os.path.exists(task['wclfile']):
-                print "Error: input wcl file does not exist (%s)" % task['wclfile']
-                return (1, jobfiles, jwcl, 0, task['wrapnum'], pid)
-
-            with open(task['wclfile'], 'r') as wclfh:
-                wcl.read(wclfh, filename=task['wclfile'])
-            wcl.update(jwcl)
-
             sys.stdout.flush()
 
             # set up the working directory if needed
@@ -1052,55 +1508,96 @@ def job_thread(argv):
                 workdir = None
             setup_wrapper(wcl, task['logfile'], workdir, ins)
 
-            print "Running wrapper: %s" % (wrappercmd)
+            print("Running wrapper: %s" % (wrappercmd))
             sys.stdout.flush()
             starttime = time.time()
             try:
                 exitcode = pfwutils.run_cmd_qcf(wrappercmd, task['logfile'],
                                                 wcl['execnames'])
             except:
-                (extype, exvalue, trback) = sys.exc_info()
-                print '!' * 60
-                print "%s: %s" % (extype, str(exvalue))
+                (extype, exvalue, _) = sys.exc_info()
+                print('!' * 60)
+                print("%s: %s" % (extype, str(exvalue)))
 
-                traceback.print_exception(extype, exvalue, trback, file=sys.stdout)
+                traceback.print_exc(file=sys.stdout)
                 exitcode = pfwdefs.PF_EXIT_FAILURE
             sys.stdout.flush()
             if exitcode != pfwdefs.PF_EXIT_SUCCESS:
-                print "Error: wrapper %s exited with non-zero exit code %s.   Check log:" % \
-                    (wcl[pfwdefs.PF_WRAPNUM], exitcode),
+                print("Error: wrapper %s exited with non-zero exit code %s.   Check log:" % \
+                    (wcl[pfwdefs.PF_WRAPNUM], exitcode), end=' ')
                 logfilename = miscutils.parse_fullname(wcl['log'], miscutils.CU_PARSE_FILENAME)
-                print " %s/%s" % (wcl['log_archive_path'], logfilename)
-            print "DESDMTIME: run_wrapper %0.3f" % (time.time()-starttime)
+                print(" %s/%s" % (wcl['log_archive_path'], logfilename))
+            print_desdmtime('run_wrapper', starttime)
 
-            print "Post-steps (exit: %s)" % (exitcode)
+            print("Post-steps (exit: %s)" % (exitcode))
             post_wrapper(wcl, ins, jobfiles, task['logfile'], exitcode, workdir)
 
             if exitcode:
                 miscutils.fwdebug_print("Aborting due to non-zero exit code")
         except:
-            print traceback.format_exc()
+            print(traceback.format_exc())
             exitcode = pfwdefs.PF_EXIT_FAILURE
-            exc_type, exc_value, exc_traceback = sys.exc_info()
-            traceback.print_exception(exc_type, exc_value, exc_traceback,
-                                      limit=4, file=sys.stdout)
+            traceback.print_exc(limit=4, file=sys.stdout)
 
         finally:
             if stdp is not None:
+                stdp.close()
                 sys.stdout = stdporig
             if stde is not None:
+                stde.close()
                 sys.stderr = stdeorig
             sys.stdout.flush()
             sys.stderr.flush()
+            # hand wrapper outputs still to be transferred and timings to the main process
+            jobfiles['pending_transfers'] = take_pending_transfers()
+            jobfiles['desdm_times'] = take_desdm_times()
+            # pool workers are reused, so never leave one inside a fw thread working dir
+            if os.getcwd() != startdir:
+                os.chdir(startdir)
 
             return (exitcode, jobfiles, wcl, wcl['wrap_usage'], task['wrapnum'], pid)
     except:
-        print "Error: Unhandled exception in job_thread."
-        exc_type, exc_value, exc_traceback = sys.exc_info()
-        traceback.print_exception(exc_type, exc_value, exc_traceback,
-                                  limit=4, file=sys.stdout)
+        print("Error: Unhandled exception in job_thread.")
+        traceback.print_exc(limit=4, file=sys.stdout)
         return (1, None, None, 0.0, '-1', pid)
 
+######################################################################
+def child_pids(ppid):
+    """ Return the pids of the direct children of ppid and of all their
+        descendants, from one pass over /proc """
+    bypid = {}
+    for pid in os.listdir('/proc'):
+        if not pid.isdigit():
+            continue
+        try:
+            with open('/proc/%s/stat' % pid, 'r') as statfh:
+                # the command name may contain spaces, the ppid follows the state
+                # after its closing parenthesis
+                parent = int(statfh.read().rsplit(')', 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue    # process went away
+        bypid.setdefault(parent, []).append(int(pid))
+
+    children = bypid.get(ppid, [])
+    descendants = []
+    todo = list(children)
+    while todo:
+        kids = bypid.get(todo.pop(), [])
+        descendants.extend(kids)
+        todo.extend(kids)
+    return (children, descendants)
+
+######################################################################
+def send_sigterm(pid):
+    """ Send SIGTERM to pid, ignoring it if it already exited """
+    try:
+        os.kill(pid, signal.SIGTERM)
+    except OSError as exc:
+        if exc.errno != errno.ESRCH:
+            traceback.print_exc(limit=4, file=sys.stdout)
+    except:
+        traceback.print_exc(limit=4, file=sys.stdout)
+
 ######################################################################
 def terminate(save=[], force=False):
     """ docstring """
@@ -1113,57 +1610,44 @@ def terminate(save=[], force=False):
         global terminating
         terminating = True
         try:
-            pool._taskqueue = Queue.Queue()
+            pool._taskqueue = queue.Queue()
             pool._state = pl.TERMINATE
 
             pool._worker_handler._state = pl.TERMINATE
             pool._terminate.cancel()
-            parent = psutil.Process(os.getpid())
-
-            children = parent.children(recursive=False)
 
-            grandchildren = []
-            for child in children:
-                grandchildren += child.children(recursive=True)
-            for proc in grandchildren:
-                try:
-                    proc.send_signal(signal.SIGTERM)
-                except:
-                    exc_type, exc_value, exc_traceback = sys.exc_info()
-                    traceback.print_exception(exc_type, exc_value, exc_traceback,
-                                              limit=4, file=sys.stdout)
+            (children, grandchildren) = child_pids(os.getpid())
+            for pid in grandchildren:
+                send_sigterm(pid)
             # if we need to make sure all child processes are stopped
             if force:
-                for proc in children:
-                    if proc.pid in save:
-                        continue
-                    try:
-                        proc.send_signal(signal.SIGTERM)
-                    except:
-                        exc_type, exc_value, exc_traceback = sys.exc_info()
-                        traceback.print_exception(exc_type, exc_value, exc_traceback,
-                                                  limit=4, file=sys.stdout)
+                for pid in children:
+                    if pid not in save:
+                        send_sigterm(pid)
 
         except:
-            exc_type, exc_value, exc_traceback = sys.exc_info()
-            traceback.print_exception(exc_type, exc_value, exc_traceback,
-                                      limit=4, file=sys.stdout)
+            traceback.print_exc(limit=4, file=sys.stdout)
         keeprunning = False
 
+######################################################################
+def wait_for_workers(timeout, save=()):
+    """ Wait up to timeout seconds for the pool workers, other than those
+        in save, to exit """
+    #pylint: disable=protected-access
+    deadline = time.time() + timeout
+    while pool is not None and time.time() < deadline:
+        if not any(proc.is_alive() for proc in pool._pool if proc.pid not in save):
+            break
+        time.sleep(0.1)
+
 ######################################################################
 def results_checker(result):
     """ method to collec the results  """
-    global pool
-    global stop_all
-    global results
     global jobfiles_global
     global jobwcl
     global job_track
-    global result_lock
-    global lock_monitor
     global donejobs
     global keeprunning
-    global terminating
     try:
         (res, jobf, wcl, usage, wrapnum, pid) = result
         jobfiles_global['outfullnames'].extend(jobf['outfullnames'])
@@ -1172,6 +1656,61 @@ def results_checker(result):
             del job_track[wrapnum]
         if usage > jobwcl['job_max_usage']:
             jobwcl['job_max_usage'] = usage
+        for label, secs in jobf.get('desdm_times', {}).items():
+            desdm_times[label] = desdm_times.get(label, 0.0) + secs
+
+        # the wrapper is only done once its outputs are in the archives,
+        # see check_transfers
+        transfers = jobf.get('pending_transfers', [])
+        if transfers:
+            wrappers_transferring[wrapnum] = {'exitcode': res, 'wcl': wcl,
+                                              'left': len(transfers)}
+            start_transfers(wcl, transfers, wrapnum)
+            return
+    except:
+        keeprunning = False
+        print("Error: thread monitoring encountered an unhandled exception.")
+        traceback.print_exc(limit=4, file=sys.stdout)
+        results.append(1)
+        donejobs += 1
+        return
+
+    wrapper_done(res, wcl, pid)
+
+######################################################################
+def check_transfers(timeout=0):
+    """ Finish each wrapper whose outputs have all been sent, waiting up
+        to timeout seconds for a transfer to end.  A failed transfer fails
+        the wrapper whose outputs they were """
+    for (wrapnum, _, success) in finished_transfers(timeout):
+        waiting = wrappers_transferring.get(wrapnum)
+        if waiting is None:
+            continue
+        if not success and waiting['exitcode'] == 0:
+            waiting['exitcode'] = pfwdefs.PF_EXIT_FAILURE
+        waiting['left'] -= 1
+        if waiting['left'] == 0:
+            del wrappers_transferring[wrapnum]
+            # the pool worker that ran it has moved on to another wrapper
+            wrapper_done(waiting['exitcode'], waiting['wcl'], None)
+
+######################################################################
+def wrapper_done(res, wcl, pid):
+    """ Record the exit code of a finished wrapper, if it failed and
+        stop_on_fail is set, stop the other wrappers.  pid is that of the
+        pool worker to spare, if it is idle """
+    global pool
+    global stop_all
+    global results
+    global jobfiles_global
+    global job_track
+    global result_lock
+    global lock_monitor
+    global donejobs
+    global keeprunning
+    global terminating
+    try:
+        save = [pid] if pid is not None else []
         results.append(res)
         # if the current thread exited with non-zero status, then kill remaining threads
         #  but keep the log files
@@ -1182,10 +1721,9 @@ def results_checker(result):
                 try:
                     # manually end the child processes as pool.terminate can deadlock
                     # if multiple threads return with errors
-                    terminate(save=[pid], force=True)
-                    for _, (logfile, jobfiles) in job_track.iteritems():
-                        filemgmt = dynam_load_filemgmt(wcl, None)
-
+                    terminate(save=save, force=True)
+                    filemgmt = dynam_load_filemgmt(wcl, None)
+                    for (logfile, jobfiles) in job_track.values():
                         if logfile is not None and os.path.isfile(logfile):
                             # only update the log if it has not been ingested already
                             if not filemgmt.has_metadata_ingested('log', logfile):
@@ -1195,11 +1733,9 @@ def results_checker(result):
                             logfileinfo = save_log_file(filemgmt, wcl, jobfiles, logfile)
                             jobfiles_global['outfullnames'].append(logfile)
                             jobfiles_global['output_putinfo'].update(logfileinfo)
-                    time.sleep(10)
+                    wait_for_workers(10, save=save)
                 except:
-                    exc_type, exc_value, exc_traceback = sys.exc_info()
-                    traceback.print_exception(exc_type, exc_value, exc_traceback,
-                                              limit=4, file=sys.stdout)
+                    traceback.print_exc(limit=4, file=sys.stdout)
                 finally:
                     keeprunning = False
             else:
@@ -1207,10 +1743,8 @@ def results_checker(result):
 
     except:
         keeprunning = False
-        print "Error: thread monitoring encountered an unhandled exception."
-        exc_type, exc_value, exc_traceback = sys.exc_info()
-        traceback.print_exception(exc_type, exc_value, exc_traceback,
-                                  limit=4, file=sys.stdout)
+        print("Error: thread monitoring encountered an unhandled exception.")
+        traceback.print_exc(limit=4, file=sys.stdout)
         results.append(1)
     finally:
         if not result_lock.acquire(False):
@@ -1234,17 +1768,14 @@ def job_workflow(workflow, jobfiles, jwcl=WCL()):
     global job_track
     global keeprunning
     global donejobs
-    global result_lock
-    global lock_monitor
 
     infullnames = {}
     with open(workflow, 'r') as workflowfh:
         # for each wrapper execution
-        lines = workflowfh.readlines()
         sys.stdout.flush()
         inputs = {}
         # read in all of the lines in dictionaries
-        for linecnt, line in enumerate(lines):
+        for linecnt, line in enumerate(workflowfh):
             wrapnum = miscutils.fwsplit(line.strip())[0]
             task = parse_wrapper_line(line, linecnt)
             #task['logfile'] = None
@@ -1255,20 +1786,22 @@ def job_workflow(workflow, jobfiles, jwcl=WCL()):
 
             # get fullnames for inputs and outputs
             ins, _ = intgmisc.get_fullnames(wcl, wcl, None)
-            del wcl
             # save input filenames to eliminate from junk tarball later
             infullnames[wrapnum] = []
             for isect in ins:
                 for ifile in ins[isect]:
                     infullnames[wrapnum].append(ifile)
-                    jobfiles['infullnames'].extend(ifile)
-            inputs[wrapnum] = (task, copy.deepcopy(jobfiles), jwcl, ins)
+                    jobfiles['infullnames'].append(ifile)
+            # keep the parsed wcl so job_thread doesn't have to read it again,
+            # the wrapper only ever adds to its own jobfiles lists
+            inputs[wrapnum] = (task, {'infullnames': list(infullnames[wrapnum]),
+                                      'outfullnames': [],
+                                      'output_putinfo': {}}, ins, wcl)
             job_track[task['wrapnum']] = (task['logfile'], jobfiles)
         # get all of the task groupings, they will be run in numerical order
-        tasks = jwcl["fw_groups"].keys()
-        tasks.sort()
+        tasks = sorted(jwcl["fw_groups"].keys())
         # loop over each grouping
-        manager = mp.Manager()
+        poolsize = 0
         for task in tasks:
             results = []   # the results of running each task in the group
             # get the maximum number of parallel processes to run at a time
@@ -1277,111 +1810,86 @@ def job_workflow(workflow, jobfiles, jwcl=WCL()):
             tempproc = []
             # pare down the list to include only those in this run
             for p in procs:
-                if p in inputs.keys():
+                if p in inputs:
                     tempproc.append(p)
             procs = tempproc
             if nproc > 1:
                 numjobs = len(procs)
-                # set up the thread pool
-                pool = mp.Pool(processes=nproc, maxtasksperchild=2)
-                outq = manager.Queue()
-                errq = manager.Queue()
-                with lock_monitor:
-                    try:
-                        donejobs = 0
-                        # update the input files now, so that it only contains those from the current taks(s)
-                        for inp in procs:
-                            jobfiles_global['infullnames'].extend(infullnames[inp])
-                        # attach all the grouped tasks to the pool
-                        [pool.apply_async(job_thread, args=(inputs[inp] + (outq, errq, True,),), callback=results_checker) for inp in procs]
-                        pool.close()
-                        time.sleep(10)
-                        while donejobs < numjobs and keeprunning:
-                            count = 0
-                            while count < 2:
-                                count = 0
-                                try:
-                                    msg = outq.get_nowait()
-                                    print msg
-                                except:
-                                    count += 1
-                                try:
-                                    errm = errq.get_nowait()
-                                    sys.stderr.write(errm)
-                                except:
-                                    count += 1
-                            time.sleep(.1)
-                    except:
+                # set up the worker pool once and reuse it for every group of the same width
+                if pool is not None and poolsize != nproc:
+                    close_pool()
+                if pool is None:
+                    # don't fork the pool with the transfer threads running
+                    stop_transfer_pool()
+                    logqueues = start_log_readers(nproc)
+                    pool = mp.Pool(processes=nproc, initializer=init_worker,
+                                   initargs=(jwcl, logqueues, mp.Value('i', 0)))
+                    poolsize = nproc
+                start_transfer_pool(nproc)
+                try:
+                    donejobs = 0
+                    # update the input files now, so that it only contains those from the current taks(s)
+                    for inp in procs:
+                        jobfiles_global['infullnames'].update(infullnames[inp])
+                    # hand all the grouped tasks to the pool and check each result as it
+                    # comes back, output is printed by the log reader threads meanwhile
+                    taskresults = pool.imap_unordered(job_thread, [inputs[inp] + (True,) for inp in procs])
+                    returned = 0
+                    while donejobs < numjobs and keeprunning:
+                        if returned == numjobs:
+                            # only outputs of finished wrappers left to send
+                            check_transfers(1)
+                            continue
+                        try:
+                            result = taskresults.next(timeout=1)
+                            returned += 1
+                            results_checker(result)
+                        except mp.TimeoutError:
+                            pass
+                        check_transfers()
+                except:
+                    results.append(1)
+                    traceback.print_exc(limit=4, file=sys.stdout)
+
+                    raise
+
+                finally:
+                    if stop_all and max(results) > 0:
+                        # empty the worker queue so nothing else starts
+                        terminate(force=True)
+                        # wait so everything can clean up, otherwise risk a deadlock
+                        wait_for_workers(70)
+                        pool = None
+                    # in case the sci code crashed badly
+                    if not results:
                         results.append(1)
-                        exc_type, exc_value, exc_traceback = sys.exc_info()
-                        traceback.print_exception(exc_type, exc_value, exc_traceback,
-                                                  limit=4, file=sys.stdout)
-
-                        raise
-
-                    finally:
-                        if stop_all and max(results) > 0:
-                            # wait to give everything time to do the first round of cleanup
-                            time.sleep(20)
-                            # get any waiting messages
-                            for _ in range(1000):
-                                try:
-                                    msg = outq.get_nowait()
-                                    print msg
-                                except:
-                                    break
-                            for _ in range(1000):
-                                try:
-                                    errm = errq.get_nowait()
-                                    sys.stderr.write(errm)
-                                except:
-                                    break
-                            if not result_lock.acquire(False):
-                                lock_monitor.wait(60)
-                            else:
-                                result_lock.release()
-                            # empty the worker queue so nothing else starts
-                            terminate(force=True)
-                            # wait so everything can clean up, otherwise risk a deadlock
-                            time.sleep(50)
-                        del pool
-                        while True:
-                            try:
-                                msg = outq.get(timeout=.1)
-                                print msg
-                            except:
-                                break
-
-                        while True:
-                            try:
-                                errm = errq.get(timeout=.1)
-                                sys.stderr.write(errm)
-                            except:
-                                break
-                        # in case the sci code crashed badly
-                        if not results:
-                            results.append(1)
-                        jobfiles = jobfiles_global
-                        jobfiles['infullnames'] = list(set(jobfiles['infullnames']))
-                        if stop_all and max(results) > 0:
-                            return max(results), jobfiles
+                    jobfiles = jobfiles_global
+                    if stop_all and max(results) > 0:
+                        return max(results), jobfiles
             # if running in single threaded mode
             else:
                 temp_stopall = stop_all
                 stop_all = False
+                start_transfer_pool(1)
 
                 donejobs = 0
                 for inp in procs:
                     try:
-                        jobfiles_global['infullnames'].extend(infullnames[inp])
-                        results_checker(job_thread(inputs[inp] + (sys.stdout, sys.stderr, False,)))
+                        jobfiles_global['infullnames'].update(infullnames[inp])
+                        results_checker(job_thread(inputs[inp] + (False,)))
+                        check_transfers()
                     except:
-                        (extype, exvalue, trback) = sys.exc_info()
-                        traceback.print_exception(extype, exvalue, trback, file=sys.stdout)
+                        traceback.print_exc(file=sys.stdout)
                         results = [1]
                     jobfiles = jobfiles_global
-                    if results[-1] != 0:
-                        return results[-1], jobfiles
+                    # wrappers earlier in the group may only now have failed
+                    # to send their outputs
+                    if results and max(results) != 0:
+                        return max(results), jobfiles
+                while donejobs < len(procs):
+                    check_transfers(1)
+                    if results and max(results) != 0:
+                        return max(results), jobfiles_global
                 stop_all = temp_stopall
 
 
@@ -1398,7 +1906,7 @@ def run_job(args):
     jobfiles = {'infullnames': [args.config, args.workflow],
                 'outfullnames': [],
                 'output_putinfo': {}}
-    jobfiles_global = {'infullnames': [args.config, args.workflow],
+    jobfiles_global = {'infullnames': {args.config, args.workflow},
                        'outfullnames': [],
                        'output_putinfo': {}}
 
@@ -1429,34 +1937,44 @@ def run_job(args):
 
     try:
         jobfiles['infullnames'] = gather_initial_fullnames()
-        jobfiles_global['infullnames'].extend(jobfiles['infullnames'])
-        miscutils.coremakedirs('log')
-        miscutils.coremakedirs('outputwcl')
+        jobfiles_global['infullnames'].update(jobfiles['infullnames'])
+        made_dirs.clear()
+        makedirs_once('log')
+        makedirs_once('outputwcl')
         exitcode, jobfiles = job_workflow(args.workflow, jobfiles, jobwcl)
     except Exception:
-        (extype, exvalue, trback) = sys.exc_info()
-        print '!' * 60
-        traceback.print_exception(extype, exvalue, trback, file=sys.stdout)
+        print('!' * 60)
+        traceback.print_exc(file=sys.stdout)
         exitcode = pfwdefs.PF_EXIT_FAILURE
-        print "Aborting rest of wrapper executions.  Continuing to end-of-job tasks\n\n"
+        print("Aborting rest of wrapper executions.  Continuing to end-of-job tasks\n\n")
+    finally:
+        close_pool()
 
     try:
         create_junk_tarball(jobwcl, jobfiles, exitcode)
     except:
-        print "Error creating junk tarball"
+        print("Error creating junk tarball")
+    # wait for any wrapper outputs still being sent
+    if not finish_transfers():
+        print("Error: problems transferring wrapper outputs to archive")
+        exitcode = pfwdefs.PF_EXIT_FAILURE
     # if should transfer at end of job
     if jobfiles['output_putinfo']:
-        print "\n\nCalling file transfer for end of job (%s files)" % \
-              (len(jobfiles['output_putinfo']))
+        print("\n\nCalling file transfer for end of job (%s files)" % \
+              (len(jobfiles['output_putinfo'])))
 
         copy_output_to_archive(jobwcl, jobfiles, jobfiles['output_putinfo'], 'job',
                                'job_output', exitcode)
     else:
-        print "\n\n0 files to transfer for end of job"
-        if miscutils.fwdebug_check(1, "PFWRUNJOB_DEBUG"):
+        print("\n\n0 files to transfer for end of job")
+        if DBG1:
             miscutils.fwdebug_print("len(jobfiles['outfullnames'])=%s" % \
                                     (len(jobfiles['outfullnames'])))
-    print "\nDESDMTIME: pfwrun_job %0.3f" % (time.time()-jobstart)
+    print("\nTotal time in each step over all wrappers:")
+    for label in sorted(desdm_times):
+        print("DESDMTIME: total_%s %0.3f" % (label, desdm_times[label]))
+    sys.stdout.write("\n")
+    print_desdmtime('pfwrun_job', jobstart)
     return exitcode
 
 ###############################################################################
@@ -1477,7 +1995,7 @@ def create_compression_wdf(wgb_fnames):
 def call_compress_files(jwcl, jobfiles, putinfo):
     """ Compress output files as specified """
 
-    if miscutils.fwdebug_check(3, "PFWRUNJOB_DEBUG"):
+    if DBG3:
         miscutils.fwdebug_print("BEG")
 
     # determine which files need to be compressed
@@ -1486,60 +2004,75 @@ def call_compress_files(jwcl, jobfiles, putinfo):
         if fdict['filecompress']:
             to_compress.append(fdict['src'])
 
-    if miscutils.fwdebug_check(6, "PFWRUNJOB_DEBUG"):
+    if DBG6:
         miscutils.fwdebug_print("to_compress = %s" % to_compress)
 
-    if to_compress:
+    if not to_compress:
         miscutils.fwdebug_print("0 files to compress")
+        if DBG3:
+            miscutils.fwdebug_print("END")
+        return
+
+    # every wrapper running in the pool compresses its own outputs at the
+    # same time, so each gets its share of the cpus unless the wcl says
+    if pfwdefs.COMPRESSION_THREADS in jwcl:
+        num_threads = int(jwcl[pfwdefs.COMPRESSION_THREADS])
     else:
-        errcnt = 0
-        (res, _, _) = pfwcompress.compress_files(to_compress,
-                                                 jwcl[pfwdefs.COMPRESSION_SUFFIX],
-                                                 jwcl[pfwdefs.COMPRESSION_EXEC],
-                                                 jwcl[pfwdefs.COMPRESSION_ARGS],
-                                                 3, jwcl[pfwdefs.COMPRESSION_CLEANUP])
-
-        filelist = []
-        wgb_fnames = []
-        for fname, fdict in res.items():
-            if miscutils.fwdebug_check(3, 'PFWRUNJOB_DEBUG'):
-                miscutils.fwdebug_print("%s = %s" % (fname, fdict))
-
-            if fdict['err'] is None:
-                # add new filename to jobfiles['outfullnames'] so not junk
-                jobfiles['outfullnames'].append(fdict['outname'])
-
-                # update jobfiles['output_putinfo'] for transfer
-                (filename, compression) = miscutils.parse_fullname(fdict['outname'],
-                                                                   miscutils.CU_PARSE_FILENAME | miscutils.CU_PARSE_EXTENSION)
-                if filename in putinfo:
-                    # info for desfile entry
-                    dinfo = diskutils.get_single_file_disk_info(fdict['outname'],
-                                                                save_md5sum=True,
-                                                                archive_root=None)
-                    # compressed file should be one saved to archive
-                    putinfo[filename]['src'] = fdict['outname']
-                    putinfo[filename]['compression'] = compression
-                    putinfo[filename]['dst'] += compression
-
-                    del dinfo['path']
-                    wgb_fnames.append(filename + compression)
-                    dinfo['filetype'] = putinfo[filename]['filetype']
-                    filelist.append(dinfo)
-
-                else:
-                    miscutils.fwdie("Error: compression mismatch %s" % filename,
-                                    pfwdefs.PF_EXIT_FAILURE)
-            else:  # errstr
-                miscutils.fwdebug_print("WARN: problem compressing file - %s" % fdict['err'])
-                errcnt += 1
+        num_threads = mp.cpu_count() // pool_width
+    num_threads = max(1, num_threads)
+
+    errcnt = 0
+    (res, _, _) = pfwcompress.compress_files(to_compress,
+                                             jwcl[pfwdefs.COMPRESSION_SUFFIX],
+                                             jwcl[pfwdefs.COMPRESSION_EXEC],
+                                             jwcl[pfwdefs.COMPRESSION_ARGS],
+                                             3,
+                                             jwcl[pfwdefs.COMPRESSION_CLEANUP],
+                                             num_threads=num_threads)
+
+    filelist = []
+    wgb_fnames = []
+    for fname, fdict in res.items():
+        if DBG3:
+            miscutils.fwdebug_print("%s = %s" % (fname, fdict))
+
+        if fdict['err'] is None:
+            # add new filename to jobfiles['outfullnames'] so not junk
+            jobfiles['outfullnames'].append(fdict['outname'])
+
+            # update jobfiles['output_putinfo'] for transfer
+            (filename, compression) = miscutils.parse_fullname(fdict['outname'],
+                                                               miscutils.CU_PARSE_FILENAME | miscutils.CU_PARSE_EXTENSION)
+            if filename in putinfo:
+                # info for desfile entry
+                dinfo = diskutils.get_single_file_disk_info(fdict['outname'],
+                                                            save_md5sum=True,
+                                                            archive_root=None)
+                # compressed file should be one saved to archive
+                putinfo[filename]['src'] = fdict['outname']
+                putinfo[filename]['compression'] = compression
+                putinfo[filename]['dst'] += compression
+
+                del dinfo['path']
+                wgb_fnames.append(filename + compression)
+                dinfo['filetype'] = putinfo[filename]['filetype']
+                filelist.append(dinfo)
 
-        # register compressed file with file manager, save used provenance info
+            else:
+                miscutils.fwdie("Error: compression mismatch %s" % filename,
+                                pfwdefs.PF_EXIT_FAILURE)
+        else:  # errstr
+            miscutils.fwdebug_print("WARN: problem compressing file - %s" % fdict['err'])
+            errcnt += 1
+
+    # register compressed file with file manager, save used provenance info
+    # (nothing to register, and no filemgmt connection needed, if all failed)
+    if filelist:
         filemgmt = dynam_load_filemgmt(jwcl, None)
         for finfo in filelist:
             filemgmt.save_desfile(finfo)
 
-    if miscutils.fwdebug_check(3, "PFWRUNJOB_DEBUG"):
+    if DBG3:
         miscutils.fwdebug_print("END")
 
 ################################################################################
@@ -1554,50 +2087,35 @@ def create_junk_tarball(wcl, jobfiles, exitcode):
     # output files are only those listed as outputs in outout wcl
 
     miscutils.fwdebug_print("BEG")
-    if miscutils.fwdebug_check(1, "PFWRUNJOB_DEBUG"):
+    if DBG1:
         miscutils.fwdebug_print("# infullnames = %s" % len(jobfiles['infullnames']))
         miscutils.fwdebug_print("# outfullnames = %s" % len(jobfiles['outfullnames']))
-    if miscutils.fwdebug_check(11, "PFWRUNJOB_DEBUG"):
+    if DBG11:
         miscutils.fwdebug_print("infullnames = %s" % jobfiles['infullnames'])
         miscutils.fwdebug_print("outfullnames = %s" % jobfiles['outfullnames'])
 
     junklist = []
 
     # remove paths
-    notjunk = {}
-    for fname in jobfiles['infullnames']:
-        notjunk[os.path.basename(fname)] = True
-    for fname in jobfiles['outfullnames']:
-        notjunk[os.path.basename(fname)] = True
-
-    if miscutils.fwdebug_check(11, "PFWRUNJOB_DEBUG"):
-        miscutils.fwdebug_print("notjunk = %s" % notjunk.keys())
+    notjunk = {fname.rpartition('/')[2] for fname in
+               itertools.chain(jobfiles['infullnames'], jobfiles['outfullnames'])}
+
+    if DBG11:
+        miscutils.fwdebug_print("notjunk = %s" % list(notjunk))
     # walk job directory to get all files
     miscutils.fwdebug_print("Looking for files at add to junk tar")
-    cwd = '.'
-    for (dirpath, _, filenames) in os.walk(cwd):
-        for walkname in filenames:
-            if miscutils.fwdebug_check(13, "PFWRUNJOB_DEBUG"):
-                miscutils.fwdebug_print("walkname = %s" % walkname)
-            if walkname not in notjunk:
-                if miscutils.fwdebug_check(6, "PFWRUNJOB_DEBUG"):
-                    miscutils.fwdebug_print("Appending walkname to list = %s" % walkname)
-
-                if dirpath.startswith('./'):
-                    dirpath = dirpath[2:]
-                elif dirpath == '.':
-                    dirpath = ''
-                if dirpath:
-                    fname = "%s/%s" % (dirpath, walkname)
-                else:
-                    fname = walkname
-
-                if not os.path.islink(fname):
-                    junklist.append(fname)
-
-    if miscutils.fwdebug_check(1, "PFWRUNJOB_DEBUG"):
+    for fname in walk_files_threaded('.'):
+        walkname = os.path.basename(fname)
+        if DBG13:
+            miscutils.fwdebug_print("walkname = %s" % walkname)
+        if walkname not in notjunk and not os.path.islink(fname):
+            if DBG6:
+                miscutils.fwdebug_print("Appending walkname to list = %s" % walkname)
+            junklist.append(fname[2:])
+
+    if DBG1:
         miscutils.fwdebug_print("# in junklist = %s" % len(junklist))
-    if miscutils.fwdebug_check(11, "PFWRUNJOB_DEBUG"):
+    if DBG11:
         miscutils.fwdebug_print("junklist = %s" % junklist)
 
     putinfo = {}
@@ -1610,8 +2128,7 @@ def create_junk_tarball(wcl, jobfiles, exitcode):
             pfw_save_file_info(filemgmt, 'junk_tar', [wcl['junktar']],
                                False, None, wcl['filename_pattern']['junktar'])
         except:
-            (extype, exvalue, trback) = sys.exc_info()
-            traceback.print_exception(extype, exvalue, trback, file=sys.stdout)
+            traceback.print_exc(file=sys.stdout)
 
         parsemask = miscutils.CU_PARSE_FILENAME|miscutils.CU_PARSE_COMPRESSION
         (filename, compression) = miscutils.parse_fullname(wcl['junktar'], parsemask)
@@ -1651,12 +2168,12 @@ def parse_args(argv):
     args = parser.parse_args(argv)
 
     if args.version:
-        print __version__
+        print(__version__)
         sys.exit(0)
 
     return args
 
 if __name__ == '__main__':
     os.environ['PYTHONUNBUFFERED'] = 'true'
-    print "Cmdline given: %s" % ' '.join(sys.argv)
+    print("Cmdline given: %s" % ' '.join(sys.argv))
     sys.exit(run_job(parse_args(sys.argv[1:])))
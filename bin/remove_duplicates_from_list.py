@@ -3,23 +3,24 @@
 
 import sys
 
-IDs = []
+IDs = set()
 def main():
     """ Main func """
     global IDs
     filename = sys.argv[1]
     col = int(sys.argv[2])
 
-    for line in open(filename).readlines():
+    with open(filename, 'r') as listfh:
+        for line in listfh:
 
-        if line[0] == "#":
-            continue
+            if line[0] == "#":
+                continue
 
-        vals = line.split()
-        ID = vals[col]
-        if ID not in IDs:
-            print line.rstrip()
-            IDs.append(ID)
+            vals = line.split()
+            ID = vals[col]
+            if ID not in IDs:
+                sys.stdout.write(line.rstrip() + '\n')
+                IDs.add(ID)
 
 if __name__ == "__main__":
     main()
@@ -11,12 +11,9 @@ import despyfitsutils.fitsutils as fitsutils
 
 def read_list(listname):
     """ Read output catalog names from list file """
-    outfiles = []
-    with open(listname, 'r') as listfh:
-        outfiles = listfh.readlines()
-
     # Strip \n from list if present
-    return [f.strip() for f in outfiles]
+    with open(listname, 'r') as listfh:
+        return [f.strip() for f in listfh]
 
 
 def main():
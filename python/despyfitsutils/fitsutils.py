@@ -10,10 +10,17 @@
 
 import re
 import os
+import mmap
 from astropy.io import fits
 
 import despymisc.miscutils as miscutils
 
+# comma separated file lists, ignoring whitespace around the commas
+COMMA_RE = re.compile(r"\s*,\s*")
+# start of each solution and end of each header in a SCAMP .head file
+SCAMP_HIST_RE = re.compile(br"^HISTORY   Astrometric solution by SCAMP", re.MULTILINE)
+SCAMP_END_RE = re.compile(br"^END", re.MULTILINE)
+
 
 #######################################################################
 def combine_cats(incats, outcat):
@@ -29,36 +36,38 @@ def combine_cats(incats, outcat):
     """
 
     # if incats is comma-separated list, split into python list
-    comma_re = re.compile(r"\s*,\s*")
-    incat_lst = comma_re.split(incats)
+    incat_lst = COMMA_RE.split(incats)
 
-    if miscutils.fwdebug_check(3, 'FITSUTILS_DEBUG'):
-        miscutils.fwdebug_print("Constructing hdulist object for single fits file")
-    # Construct hdulist object to append hdus from individual catalogs to
-    hdulist = fits.HDUList()
-
-    # Now append the hdus from each input catalog file to the hdulist
-    for incat in incat_lst:
-        if miscutils.fwdebug_check(3, 'FITSUTILS_DEBUG'):
-            miscutils.fwdebug_print("Appending 3 HDUs from cat --> %s" % incat)
-        hdulist1 = fits.open(incat, mode='readonly')
-        hdulist.append(hdulist1[0])
-        hdulist.append(hdulist1[1])
-        hdulist.append(hdulist1[2])
-        #hdulist1.close()
-
-    # And write the full hdulist to the output file
-    if os.path.exists(outcat):
-        os.remove(outcat)
-        miscutils.fwdebug_print("Removing pre-existing version of fullcat %s" % outcat)
+    # build the fullcat under a temporary name and rename it into place when
+    # complete, so a pre-existing version is only replaced by a whole file
+    tmpcat = outcat + '.tmp'
+    if os.path.exists(tmpcat):
+        os.remove(tmpcat)
 
     if miscutils.fwdebug_check(3, 'FITSUTILS_DEBUG'):
         miscutils.fwdebug_print("Writing results to fullcat --> %s" % outcat)
-    hdulist.writeto(outcat)
 
-    if miscutils.fwdebug_check(6, 'FITSUTILS_DEBUG'):
-        miscutils.fwdebug_print("Using fits_close to close fullcat --> %s" % outcat)
-    hdulist.close()
+    try:
+        # open the fullcat once, fits.append would reopen and reread it for every hdu
+        with fits.open(tmpcat, mode='append') as fullcat:
+            for incat in incat_lst:
+                if miscutils.fwdebug_check(3, 'FITSUTILS_DEBUG'):
+                    miscutils.fwdebug_print("Appending 3 HDUs from cat --> %s" % incat)
+                with fits.open(incat, mode='readonly', memmap=True) as hdulist1:
+                    # the primary hdus after the first are appended as image extensions
+                    for hdu in hdulist1[0:3]:
+                        fullcat.append(hdu)
+                    # write them out before opening the next catalog, so only
+                    # one (memory mapped) catalog is read at a time
+                    fullcat.flush()
+    except:
+        if os.path.exists(tmpcat):
+            os.remove(tmpcat)
+        raise
+
+    if os.path.exists(outcat):
+        miscutils.fwdebug_print("Replacing pre-existing version of fullcat %s" % outcat)
+    os.rename(tmpcat, outcat)
 
 
 def splitScampHead(head_out, heads):
@@ -80,45 +89,43 @@ def splitScampHead(head_out, heads):
             expected number of outputs is not found in the input file.
     """
 
-    comma_re = re.compile(r"\s*,\s*")
-    head_lst = comma_re.split(heads)
+    head_lst = COMMA_RE.split(heads)
     reqheadcount = len(head_lst)
-    headcount = 0
-    endcount = 0
-    linecount = 0
-    linecount_tot = 0
-    filehead = None
-    for line in open(head_out, 'r'):
-        if re.match("^HISTORY   Astrometric solution by SCAMP.*", line):
-            if filehead != None:
-                filehead.close()
-                if miscutils.fwdebug_check(3, 'FITSUTILS_DEBUG'):
-                    miscutils.fwdebug_print("Closing .head file after writing %d lines." % linecount)
-                if endcount != headcount:
-                    miscutils.fwdebug_print("Error: problem when writing %s" % head_lst[headcount])
-                    raise ValueError("Number of END lines (%d) does not match number of HISTORY lines (%d)" % (endcount, headcount))
-            if miscutils.fwdebug_check(3, 'FITSUTILS_DEBUG'):
-                miscutils.fwdebug_print("Opening .head file %d --> %s" % (headcount, head_lst[headcount]))
-            filehead = open(head_lst[headcount], 'w')
-            headcount += 1
-            linecount = 0
-        elif re.match(r"^END\s*", line):
-            endcount += 1
-        filehead.write(line)
-        linecount += 1
-        linecount_tot += 1
-    filehead.close()
-
-    if endcount != headcount:
-        miscutils.fwdebug_print("Error: problem when writing %s" % head_lst[headcount])
-        raise ValueError("Number of END lines (%d) does not match number of HISTORY lines (%d)" % \
-                         (endcount, headcount))
 
-    if miscutils.fwdebug_check(3, 'FITSUTILS_DEBUG'):
-        miscutils.fwdebug_print("Closing .head file after writing %d lines.\n" % linecount)
+    # split the mapped file into one block per solution with a single regex
+    # scan, writing the raw bytes out without going through it line by line
+    with open(head_out, 'rb') as headfh:
+        if os.fstat(headfh.fileno()).st_size == 0:
+            raise ValueError("%s does not start with a SCAMP HISTORY line" % head_out)
+        text = mmap.mmap(headfh.fileno(), 0, access=mmap.ACCESS_READ)
 
-    if headcount != reqheadcount:
-        raise ValueError("Number of head files made (%d) does not match required number of head files (%d)" % (headcount, reqheadcount))
+    try:
+        starts = [match.start() for match in SCAMP_HIST_RE.finditer(text)]
+        if not starts or text[:starts[0]].strip():
+            raise ValueError("%s does not start with a SCAMP HISTORY line" % head_out)
+
+        headcount = len(starts)
+        if headcount != reqheadcount:
+            raise ValueError("Number of head files made (%d) does not match required number of head files (%d)" % (headcount, reqheadcount))
+
+        starts.append(len(text))
+        endcount = 0
+        for headnum in range(headcount):
+            block = text[starts[headnum]:starts[headnum+1]]
+            endcount += len(SCAMP_END_RE.findall(block))
+            if endcount != headnum + 1:
+                miscutils.fwdebug_print("Error: problem when writing %s" % head_lst[headnum])
+                raise ValueError("Number of END lines (%d) does not match number of HISTORY lines (%d)" % \
+                                 (endcount, headnum + 1))
+
+            if miscutils.fwdebug_check(3, 'FITSUTILS_DEBUG'):
+                miscutils.fwdebug_print("Opening .head file %d --> %s" % (headnum, head_lst[headnum]))
+            with open(head_lst[headnum], 'wb') as filehead:
+                filehead.write(block)
+            if miscutils.fwdebug_check(3, 'FITSUTILS_DEBUG'):
+                miscutils.fwdebug_print("Closing .head file after writing %d lines." % block.count(b'\n'))
+    finally:
+        text.close()
 
 
 #######################################################################
@@ -6,12 +6,17 @@
 
     Specialized functions for computing metadata for FITS files
 """
-import calendar
+import datetime
 import re
 import math
+import numpy as np
 
 
 VALID_BANDS = ['u', 'g', 'r', 'i', 'z', 'Y', 'VR', 'N964', 'N662']
+VALID_BANDS_SET = frozenset(VALID_BANDS)
+ONE_DAY = datetime.timedelta(days=1)
+# field is the value after 'hex' in the OBJECT keyword
+HEX_FIELD_RE = re.compile(r" hex (\S+)")
 
 ######################################################################
 def create_band(flter):
@@ -35,12 +40,35 @@ def create_band(flter):
             If the detected band is not in the list of valid bands
     """
 
-    band = flter.split(' ')[0]
-    if band not in VALID_BANDS:
+    band = flter.partition(' ')[0]
+    if band not in VALID_BANDS_SET:
         raise KeyError("filter yields invalid band")
     return band
 
 
+######################################################################
+def create_band_array(flters):
+    """ Create the bands for an array of filter names, as create_band
+        does for one, with the string operations done by numpy rather
+        than per value.  Invalid bands are flagged instead of raising,
+        so the rows can be filtered with the mask.
+
+        Parameters
+        ----------
+        flters : array like
+            The filter names, usually taken from header values.
+
+        Returns
+        -------
+        tuple
+            The bands as an object array of str, and a bool array that
+            is True where the band is valid.
+    """
+    bands = np.char.partition(np.asarray(flters, dtype=str), ' ')[..., 0]
+    valid = np.in1d(bands, VALID_BANDS).reshape(bands.shape)
+    return (bands.astype(object), valid)
+
+
 ######################################################################
 def create_camsym(instrume):
     """ Create the camsym from the instrument header keyword.
@@ -85,24 +113,38 @@ def create_nite(date_obs):
         >>> create_nite('2018-01-01T02:00:30.2')
             '20171231'
     """
-    # date_obs = 'YYYY-MM-DDTHH:MM:SS.S'
-    v = date_obs.split(':')
-    hh = int(v[0].split('-')[2][-2:])
-    if hh > 14:
-        nite = v[0][:-3].replace('-', '')
-    else:
-        y = int(v[0][0:4])
-        m = int(v[0][5:7])
-        d = int(v[0][8:10])-1
-        if d == 0:
-            m = m - 1
-            if m == 0:
-                m = 12
-                y = y - 1
-            d = calendar.monthrange(y, m)[1]
-        nite = str(y).zfill(4)+str(m).zfill(2)+str(d).zfill(2)
-
-    return nite
+    # date_obs = 'YYYY-MM-DDTHH:MM:SS.S', fixed positions so slice directly
+    # and compare the 2-digit hour as text for the common (later) case
+    if date_obs[11:13] > '14':
+        return date_obs[0:4] + date_obs[5:7] + date_obs[8:10]
+
+    # date arithmetic handles month and year rollover
+    prev = datetime.date(int(date_obs[0:4]), int(date_obs[5:7]), int(date_obs[8:10])) - ONE_DAY
+    return '%04d%02d%02d' % (prev.year, prev.month, prev.day)
+
+######################################################################
+def create_nite_array(date_obs):
+    """ Create the nites for an array of DATE-OBS header values, as
+        create_nite does for one, with the string and date operations
+        done by numpy rather than per value.
+
+        Parameters
+        ----------
+        date_obs : array like
+            The formatted timestamps of the observation times. Format is
+            YYYY-MM-DDTHH:MM:SS.S
+
+        Returns
+        -------
+        numpy.ndarray
+            The nites of the observations, as YYYYMMDD strings.
+    """
+    (dates, _, times) = np.rollaxis(np.char.partition(np.asarray(date_obs, dtype=str), 'T'), -1)
+    hours = np.char.partition(times, ':')[..., 0].astype(int)
+    # only the date is parsed by datetime64, older numpy takes a time of day
+    # as local time, and day arithmetic handles month and year rollover
+    nites = dates.astype('datetime64[D]') - (hours < 15).astype(int).astype('timedelta64[D]')
+    return np.char.replace(nites.astype(str), '-', '')
 
 ######################################################################
 def create_field(obj):
@@ -129,7 +171,7 @@ def create_field(obj):
         >>> create_field('xyz  hex blah')
         'blah'
     """
-    m = re.search(r" hex (\S+)", obj)
+    m = HEX_FIELD_RE.search(obj)
     if m:
         field = m.group(1)
     else:
@@ -137,10 +179,40 @@ def create_field(obj):
 
     return field
 
+######################################################################
+def create_field_array(objs):
+    """ Create the fields from many OBJECT header values, as create_field
+        does for one, in a single pass with the precompiled pattern.
+
+        Parameters
+        ----------
+        objs : iterable
+            The contents of the OBJECT keywords.
+
+        Returns
+        -------
+        numpy.ndarray
+            The fields of observation, as an object array of str.
+
+        Raises
+        ------
+        KeyError
+            If any of the given data cannot be properly parsed.
+    """
+    search = HEX_FIELD_RE.search
+    fields = []
+    for obj in objs:
+        m = search(obj)
+        if not m:
+            raise KeyError("Cannot parse OBJECT (%s) for 'field' value" % obj)
+        fields.append(m.group(1))
+
+    return np.array(fields, dtype=object)
+
 ######################################################################
 def convert_ra_to_deg(ra):
     """ Convert RA in sexagesimal format to decimal degrees, rounded
-        to 6 decimal places.
+        to 6 decimal places.  Use convert_ra_to_deg_array for many values.
 
         Parameters
         ----------
@@ -153,14 +225,14 @@ def convert_ra_to_deg(ra):
             The RA in degrees.
     """
 
-    xx = map(float, ra.split(':'))
-    radeg = 15.0 * (xx[0] + xx[1]/60.0 + xx[2]/3600.0)
+    (hh, mm, ss) = ra.split(':')
+    radeg = 15.0 * (float(hh) + float(mm)/60.0 + float(ss)/3600.0)
     return round(radeg, 6)
 
 ######################################################################
 def convert_dec_to_deg(dec):
     """ Convert DEC in sexagesimal format to decimal degrees, rounded
-        to 6 decimal places.
+        to 6 decimal places.  Use convert_dec_to_deg_array for many values.
 
         Parameters
         ----------
@@ -173,16 +245,77 @@ def convert_dec_to_deg(dec):
             The DEC in degrees.
     """
 
-    lteldec = dec.split(':')
-    firstchar = lteldec[0][0]
-    xx = map(float, lteldec)
-    if firstchar == '-':
-        tdecsgn = -1.
-    else:
-        tdecsgn = 1.
-    tdecdeg = tdecsgn * (abs(xx[0]) + xx[1]/60.0 + xx[2]/3600.0)
+    (dd, mm, ss) = dec.split(':')
+    tdecdeg = abs(float(dd)) + float(mm)/60.0 + float(ss)/3600.0
+    # sign taken from the string so that e.g. -00:30:00 stays negative
+    if dd[0] == '-':
+        tdecdeg = -tdecdeg
     return round(tdecdeg, 6)
 
+######################################################################
+def split_sexagesimal_array(values):
+    """ Split an array of sexagesimal strings into its three fields, with
+        the string operations done by numpy rather than per value.
+
+        Parameters
+        ----------
+        values : array like
+            The strings in sexagesimal format (e.g. 12:30:36.5).
+
+        Returns
+        -------
+        tuple
+            The first field (still as strings so the sign can be checked),
+            and the second and third fields as float64 arrays.
+    """
+    first = np.char.partition(np.asarray(values, dtype=str), ':')
+    rest = np.char.partition(first[..., 2], ':')
+    return (first[..., 0],
+            rest[..., 0].astype(np.float64),
+            rest[..., 2].astype(np.float64))
+
+######################################################################
+def convert_ra_to_deg_array(ras):
+    """ Convert an array of RAs in sexagesimal format to decimal degrees,
+        rounded to 6 decimal places, as convert_ra_to_deg does for one.
+
+        Parameters
+        ----------
+        ras : array like
+            The RAs in sexagesimal format.
+
+        Returns
+        -------
+        numpy.ndarray
+            The RAs in degrees.
+    """
+
+    (hh, mm, ss) = split_sexagesimal_array(ras)
+    radeg = 15.0 * (hh.astype(np.float64) + mm/60.0 + ss/3600.0)
+    return np.round(radeg, 6)
+
+######################################################################
+def convert_dec_to_deg_array(decs):
+    """ Convert an array of DECs in sexagesimal format to decimal degrees,
+        rounded to 6 decimal places, as convert_dec_to_deg does for one.
+
+        Parameters
+        ----------
+        decs : array like
+            The DECs in sexagesimal format.
+
+        Returns
+        -------
+        numpy.ndarray
+            The DECs in degrees.
+    """
+
+    (dd, mm, ss) = split_sexagesimal_array(decs)
+    tdecdeg = np.abs(dd.astype(np.float64)) + mm/60.0 + ss/3600.0
+    # sign taken from the string so that e.g. -00:30:00 stays negative
+    tdecdeg = np.where(np.char.startswith(dd, '-'), -tdecdeg, tdecdeg)
+    return np.round(tdecdeg, 6)
+
 ######################################################################
 def fwhm_arcsec(farglist):
     """ Calculates the FWHM of the image in arcseconds from the input
@@ -216,18 +349,24 @@ def fwhm_arcsec(farglist):
         raise TypeError("fwhm_arcsec() takes exactly 7 arguments (%i given)" % nargs)
 
     # store values in farglist in local variables
-    fwhm = float(farglist[0])
-    cd1_1 = float(farglist[1])
-    cd1_2 = float(farglist[2])
-    cd2_1 = float(farglist[3])
-    cd2_2 = float(farglist[4])
-    pixscale1 = float(farglist[5])
-    pixscale2 = float(farglist[6])
+    (fwhm, cd1_1, cd1_2, cd2_1, cd2_2, pixscale1, pixscale2) = [float(x) for x in farglist]
+
+    if (cd1_1 == 0 or cd2_2 == 0) and (pixscale1 == 0.0 or pixscale2 == 0.0):
+        raise KeyError("pixscale doesn't exist and cd1_1 and/or cd2_2 zero")
+
+    return fwhm_arcsec_kernel(fwhm, cd1_1, cd1_2, cd2_1, cd2_2, pixscale1, pixscale2)
 
+######################################################################
+def fwhm_arcsec_kernel(fwhm, cd1_1, cd1_2, cd2_1, cd2_2, pixscale1, pixscale2):
+    """ Numeric part of fwhm_arcsec, for float arguments already checked
+        by it (pixscale keywords exist if cd1_1 or cd2_2 is zero).
+    """
     flag_pixscale_exist = False
+    pixscale_tem = 0.0
+    pixscale = 0.0
 
     # if the pixscal keywords exist, then take the average
-    if pixscale1 != 0.0 and pixscale1 != 0.0:
+    if pixscale1 != 0.0 and pixscale2 != 0.0:
         pixscale_tem = 0.5 * (pixscale1 + pixscale2)
         flag_pixscale_exist = True
 
@@ -236,27 +375,19 @@ def fwhm_arcsec(farglist):
     if cd1_1 == 0 or cd2_2 == 0:
         flag_cd11_or_cd22_zero = True
     else:
-        if cd2_1 > 0:
-            rho_a = math.atan(cd2_1 / cd1_1)
-        elif cd2_1 < 0:
-            rho_a = math.atan(-cd2_1 / -cd1_1)
-        else:
-            rho_a = 0.0
-
-        if cd1_2 > 0:
-            rho_b = math.atan(cd1_2 / -cd2_2)
-        elif cd1_2 < 0:
-            rho_b = math.atan(-cd1_2 / cd2_2)
-        else:
-            rho_b = 0.0
+        # the sign cases of the C code all reduce to the same ratio
+        # (atan(-x/-y) == atan(x/y), atan(0) == 0) and only |rho| is used,
+        # which atan2 of the magnitudes gives directly
+        abs_cd11 = math.fabs(cd1_1)
+        abs_cd22 = math.fabs(cd2_2)
+        rho_a = math.atan2(math.fabs(cd2_1), abs_cd11)
+        rho_b = math.atan2(math.fabs(cd1_2), abs_cd22)
 
         # evaluate rho and CDELTi as in Calabretta & Greisen (2002), eq 193
-        rho = 0.5 * (math.fabs(rho_a) + math.fabs(rho_b))
-        #rho=0.5*(rho_a+rho_b)
-        cdelt1 = cd1_1 / math.cos(rho)
-        cdelt2 = cd2_2 / math.cos(rho)
-        # convert the pixel to arcsec
-        pixscale = 0.5 * (math.fabs(cdelt1) + math.fabs(cdelt2)) * 3600
+        rho = 0.5 * (rho_a + rho_b)
+        # cos(rho) > 0 as 0 <= rho < pi/2, so |CDELTi| = |CDi_i| / cos(rho),
+        # then average the two and convert the pixel to arcsec (0.5 * 3600)
+        pixscale = (abs_cd11 + abs_cd22) * 1800.0 / math.cos(rho)
 
     if flag_pixscale_exist: #check if the pixscale is within 10% of the values given in header
         if not flag_cd11_or_cd22_zero:
@@ -264,7 +395,53 @@ def fwhm_arcsec(farglist):
                 pixscale = pixscale_tem
         else:
             pixscale = pixscale_tem
-    elif flag_cd11_or_cd22_zero:
-        raise KeyError("pixscale doesn't exist and cd1_1 and/or cd2_2 zero")
 
     return fwhm * pixscale
+
+######################################################################
+def fwhm_arcsec_array(fargarray):
+    """ Calculates the FWHM in arcseconds for many images at once, as
+        fwhm_arcsec does for one, with the arithmetic done by numpy.
+
+        Parameters
+        ----------
+        fargarray : array like
+            (N, 7) array with one row of fwhm_arcsec input data per image.
+
+        Returns
+        -------
+        numpy.ndarray
+            The corrected FWHMs in arcsec.
+
+        Raises
+        ------
+        TypeError
+            If the rows do not have the correct number of arguments.
+
+        KeyError
+            If the calculation cannot be done due to unexpected data elements.
+    """
+    fargs = np.asarray(fargarray, dtype=np.float64)
+    if fargs.ndim != 2 or fargs.shape[1] != 7:
+        raise TypeError("fwhm_arcsec_array() takes an (N, 7) array (%s given)" % (fargs.shape,))
+
+    (fwhm, cd1_1, cd1_2, cd2_1, cd2_2, pixscale1, pixscale2) = fargs.T
+
+    cd11_or_cd22_zero = (cd1_1 == 0) | (cd2_2 == 0)
+    pixscale_exist = (pixscale1 != 0) & (pixscale2 != 0)
+    if np.any(cd11_or_cd22_zero & ~pixscale_exist):
+        raise KeyError("pixscale doesn't exist and cd1_1 and/or cd2_2 zero")
+
+    # same formulas as fwhm_arcsec_kernel, rows with a zero cd1_1 or cd2_2
+    # give nonsense here but always take the header pixscale below
+    abs_cd11 = np.abs(cd1_1)
+    abs_cd22 = np.abs(cd2_2)
+    rho = 0.5 * (np.arctan2(np.abs(cd2_1), abs_cd11) + np.arctan2(np.abs(cd1_2), abs_cd22))
+    pixscale = (abs_cd11 + abs_cd22) * 1800.0 / np.cos(rho)
+    pixscale_tem = 0.5 * (pixscale1 + pixscale2)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        use_tem = pixscale_exist & (cd11_or_cd22_zero |
+                                    (np.abs(pixscale_tem - pixscale) / pixscale_tem > 0.10))
+
+    return fwhm * np.where(use_tem, pixscale_tem, pixscale)
@@ -12,9 +12,13 @@
 """
 
 import os
+import shutil
 import urllib
 import urllib2
 from base64 import b64encode
+from multiprocessing.pool import ThreadPool
+
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
 
 def get_credentials(desfile=os.path.join(os.environ['HOME'], '.desservices.ini'),
                     section='http-desarchive'):
@@ -83,6 +87,76 @@ def download_file_des(url, filename, desfile=None, section='http-desarchive'):
     req = Request(auth)
     req.download_file(url, filename)
 
+def download_files_des(url_filename_pairs, desfile=None, section='http-desarchive',
+                       max_workers=16):
+    """ Download several files concurrently, using the services access file
+        for credentials (read once for all of the files).
+
+        Parameters
+        ----------
+        url_filename_pairs : list
+            (url, filename) tuples, one per file to download.
+
+        desfile : str, optional
+            The name of the service access file to use, defaults to ``None``, which
+            becomes $HOME/.desservices.ini
+
+        section : str, optional
+            The section to read from the services file. Defaults to 'http-desarchive'
+
+        max_workers : int, optional
+            The maximum number of downloads in progress at once. Defaults to 16.
+
+        Returns
+        -------
+        list
+            (filename, exception) tuples in the same order as `url_filename_pairs`,
+            the exception being ``None`` if the download succeeded.
+    """
+    url_filename_pairs = list(url_filename_pairs)
+    if not url_filename_pairs:
+        return []
+
+    # Get the credentials
+    username, password, _ = get_credentials(desfile=desfile, section=section)
+    auth = (username, password)
+
+    def download_one(pair):
+        """ Download a single file, returning the outcome instead of raising """
+        (url, filename) = pair
+        try:
+            # separate Request per download as it keeps per-request state
+            Request(auth).download_file(url, filename)
+        except Exception, exc:
+            return (filename, exc)
+        return (filename, None)
+
+    # downloads spend their time waiting on the network, so threads are enough
+    pool = ThreadPool(max(1, min(max_workers, len(url_filename_pairs))))
+    try:
+        results = pool.map(download_one, url_filename_pairs)
+    finally:
+        pool.close()
+        pool.join()
+    return results
+
+def get_auth_header(auth):
+    """ Return the Basic Authorization header value for the credentials.
+
+        Parameters
+        ----------
+        auth : two element tuple
+            The username and password to use for authentication.
+
+        Returns
+        -------
+        str
+            The header value, or ``None`` if there are no credentials.
+    """
+    if not any(auth):
+        return None
+    return 'Basic ' + b64encode(auth[0] + ':' + auth[1])
+
 class Request(object):
     """ Requests class for retrieving data via http.
 
@@ -101,6 +175,20 @@ class Request(object):
         self.error_status = (False, '')
         self.data = None
 
+        # same credentials for every request, so build the header once
+        self.auth_header = get_auth_header(self.auth)
+
+    def add_auth(self, urllib_req):
+        """ Add the Authorization header to the request if there are credentials.
+
+            Parameters
+            ----------
+            urllib_req : urllib2.Request
+                The request to add the header to.
+        """
+        if self.auth_header is not None:
+            urllib_req.add_header('Authorization', self.auth_header)
+
     def POST(self, url, data=None):
         """ Send a POST to the given `url` with `data` as the body.
 
@@ -130,9 +218,7 @@ class Request(object):
             self.url = url
 
         urllib_req = urllib2.Request(self.url)
-        if any(self.auth):
-            urllib_req.add_header('Authorization',
-                                  'Basic ' + b64encode(self.auth[0] + ':' + self.auth[1]))
+        self.add_auth(urllib_req)
         try:
             self.response = urllib2.urlopen(urllib_req, urllib.urlencode(self.data))
         except Exception, exc:
@@ -162,9 +248,7 @@ class Request(object):
             self.url = url
 
         urllib_req = urllib2.Request(self.url)
-        if any(self.auth):
-            urllib_req.add_header('Authorization',
-                                  'Basic ' + b64encode(self.auth[0] + ':' + self.auth[1]))
+        self.add_auth(urllib_req)
         try:
             self.response = urllib2.urlopen(urllib_req)
             return self.response.read()
@@ -181,9 +265,35 @@ class Request(object):
 
             filename : str
                 The name of the file to create and place the contents of `url` into.
+
+            Raises
+            ------
+            ValueError
+                If the url is not a non-empty string.
         """
-        with open(filename, 'wb') as f:
-            f.write(self.get_read(url))
+        if not url:
+            raise ValueError('You need to provide an url kwarg.')
+        else:
+            self.url = url
+
+        urllib_req = urllib2.Request(self.url)
+        self.add_auth(urllib_req)
+        try:
+            self.response = urllib2.urlopen(urllib_req)
+        except Exception, exc:
+            self.error_status = (True, str(exc))
+            raise
+
+        # stream to disk rather than holding the whole file in memory
+        try:
+            with open(filename, 'wb') as f:
+                shutil.copyfileobj(self.response, f, DOWNLOAD_CHUNK_SIZE)
+        except Exception, exc:
+            self.error_status = (True, str(exc))
+            # don't leave a partial file that looks like a finished download
+            if os.path.exists(filename):
+                os.remove(filename)
+            raise
 
     def GET(self, url, params={}):
         """ Perform a GET to the given `url` with the given `params`.
@@ -207,12 +317,12 @@ class Request(object):
         else:
             self.url = url
 
-        url_params = '?'+'&'.join([str(k) + '=' + str(v) for k, v in
-                                   params.iteritems()])
+        # percent-encode the values (e.g. spaces, & and =)
+        url_params = ''
+        if params:
+            url_params = '?' + urllib.urlencode(params)
         urllib_req = urllib2.Request(self.url+url_params)
-        if any(self.auth):
-            urllib_req.add_header('Authorization',
-                                  'Basic ' + b64encode(self.auth[0] + ':' + self.auth[1]))
+        self.add_auth(urllib_req)
         try:
             self.response = urllib2.urlopen(urllib_req)
         except Exception, exc:
@@ -10,6 +10,20 @@
 import datetime
 from dateutil.parser import parse
 from dateutil import tz
+import numpy as np
+
+# Hardcode time zone
+FROM_ZONE = tz.gettz('UTC')
+TO_ZONE = tz.gettz('America/Santiago')
+# leading part of the usual date string, e.g. 2014-08-15T17:31:02
+UTC_STR_FMT = '%Y-%m-%dT%H:%M:%S'
+UTC_STR_LEN = 19
+# up to and including the hour, e.g. 2014-08-15T17
+UTC_STR_HOUR_LEN = 13
+
+# mountain's offset from UTC for each UTC hour seen (naive datetime of the
+# start of the hour -> timedelta), the offset only changes on the hour
+utc_hour_offsets = {}
 
 def convert_utc_str_to_nite(datestr):
     """ Convert an UTC date string to a nite string, it takes into account
@@ -34,22 +48,65 @@ def convert_utc_str_to_nite(datestr):
     # e.g. datestr: 2014-08-15T17:31:02.416533+00:00
     nite = None
 
-    # Hardcode time zone
-    from_zone = tz.gettz('UTC')
-    to_zone = tz.gettz('America/Santiago')
+    # convert date string to datetime object, only falling back to the
+    # general (slow) parser for unusual formats.  Any offset in the string
+    # is ignored as the time is always taken as UTC, and fractions of a
+    # second can't move the time across noon
+    try:
+        utc = datetime.datetime.strptime(datestr[:UTC_STR_LEN], UTC_STR_FMT)
+    except ValueError:
+        utc = parse(datestr)
+    if utc.tzinfo is not None:
+        utc = utc.replace(tzinfo=None)
 
-    # convert date string to datetime object
-    utc = parse(datestr)
-    utc = utc.replace(tzinfo=from_zone)
-
-    # Convert time zone to local on mountain
-    local_dt = utc.astimezone(to_zone)
-    noon_dt = local_dt.replace(hour=12, minute=0, second=0, microsecond=0)
-    if local_dt < noon_dt:  # if before noon, observing nite has previous date
+    # Convert time zone to local on mountain, only going through the time
+    # zone rules the first time an hour is seen
+    utc_hour = utc.replace(minute=0, second=0, microsecond=0)
+    offset = utc_hour_offsets.get(utc_hour)
+    if offset is None:
+        offset = utc_hour.replace(tzinfo=FROM_ZONE).astimezone(TO_ZONE).utcoffset()
+        utc_hour_offsets[utc_hour] = offset
+    local_dt = utc + offset
+    if local_dt.hour < 12:  # if before noon, observing nite has previous date
         obsdate = (local_dt - datetime.timedelta(days=1)).date()
     else:
         obsdate = local_dt.date()
 
     # Get the nite only -- not the time
-    nite = obsdate.strftime('%Y%m%d')
+    nite = '%04d%02d%02d' % (obsdate.year, obsdate.month, obsdate.day)
     return nite
+
+
+def convert_utc_strs_to_nites(datestrs):
+    """ Convert many UTC date strings to nite strings, as done by
+        convert_utc_str_to_nite.  The conversion is only done once per
+        distinct UTC hour, as the mountain's offsets from UTC are whole
+        hours and change on the hour, so all times within one UTC hour
+        belong to the same nite.
+
+        Parameters
+        ----------
+        datestrs : iterable
+            The formatted timestamps of the observation times. Format is
+            YYYY-MM-DDTHH:MM:SS.S+HH:MM
+
+        Returns
+        -------
+        list
+            The nites of the observations, in the same order
+    """
+
+    datestrs = np.asarray(list(datestrs), dtype=str)
+    if datestrs.size == 0:
+        return []
+
+    # strings in the usual format are keyed by their UTC hour, unusual ones
+    # by the whole string so their results aren't shared.  The time zone
+    # rules aren't something numpy's datetime64 knows about, so each distinct
+    # key still goes through convert_utc_str_to_nite
+    usual = (np.char.str_len(datestrs) >= UTC_STR_LEN) & (np.char.find(datestrs, 'T') == 10)
+    hourstrs = datestrs.astype('%s%d' % (datestrs.dtype.kind, UTC_STR_HOUR_LEN))
+    keys = np.where(usual, hourstrs, datestrs)
+    (_, first, inverse) = np.unique(keys, return_index=True, return_inverse=True)
+    key_nites = np.array([convert_utc_str_to_nite(datestr) for datestr in datestrs[first]])
+    return key_nites[inverse.reshape(-1)].tolist()
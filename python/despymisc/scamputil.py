@@ -45,29 +45,29 @@ def split_ahead_by_ccd(infile, outfile, ccd_list):
     # Currently doing things this way to:
     #  - avoid opening a file that will be blank at the end of this.
     #  - can check that exactly the correct number of headers are present (prior to writing).
+    remove_keywords = frozenset(remove_keywords)
     icnt = 0
-    f1 = open(infile, 'r')
     head_set = {}
-    tmp_dict = {}
+    ccd = None
     tmp_lines = []
     ccdnum_found = False
-    for line in f1:
-        line = line.strip()
-        keywd = line[0:8].split()
-        if keywd[0] == "CCDNUM":
-            columns = line.split()
-            tmp_dict["ccd"] = int(columns[2])
-            ccdnum_found = True
-        if keywd[0] not in remove_keywords:
-            tmp_lines.append(line)
-        if keywd[0] == "END":
-            if not ccdnum_found:
-                tmp_dict["ccd"] = int(icnt + 1)
-            head_set[tmp_dict["ccd"]] = tmp_lines
-            tmp_lines = []
-            tmp_dict = {}
-            icnt += 1
-    f1.close()
+    with open(infile, 'r') as f1:
+        for line in f1:
+            line = line.strip()
+            # keyword is the first 8 characters, blank lines have none
+            keywd = line[0:8].rstrip()
+            if keywd == "CCDNUM":
+                ccd = int(line.split()[2])
+                ccdnum_found = True
+            if keywd not in remove_keywords:
+                tmp_lines.append(line)
+            if keywd == "END":
+                if not ccdnum_found:
+                    ccd = icnt + 1
+                head_set[ccd] = tmp_lines
+                tmp_lines = []
+                ccd = None
+                icnt += 1
 
     # Check ahead of time that all HDUs needed are present.
     ccd_check = True
@@ -81,11 +81,12 @@ def split_ahead_by_ccd(infile, outfile, ccd_list):
         return False
 
     # Step through the list of CCDs and write each .ahead:HDU-like piece.    print len(head_set)
-    fout = open(outfile, 'w')
+    # build the whole output and write it at once rather than line by line
+    outlines = []
     for ccd in ccd_list:
         if ccd in head_set:
-            tmp_header = head_set[ccd]
-            for hline in tmp_header:
-                fout.write("%s\n" % (hline))
-    fout.close()
+            outlines.extend(head_set[ccd])
+    with open(outfile, 'w') as fout:
+        if outlines:
+            fout.write("\n".join(outlines) + "\n")
     return True
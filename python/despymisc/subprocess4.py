@@ -13,7 +13,28 @@ import subprocess
 import os
 import errno
 import signal
-import psutil
+
+def pid_exists(pid):
+    """ Whether a process with the given pid exists (signal 0 only checks,
+        nothing is delivered)
+
+        Parameters
+        ----------
+        pid : int
+            The process id to check.
+
+        Returns
+        -------
+        bool
+            ``True`` if the process exists (including as a zombie), ``False``
+            otherwise.
+    """
+    try:
+        os.kill(pid, 0)
+    except OSError as exc:
+        # EPERM means it exists but belongs to someone else
+        return exc.errno == errno.EPERM
+    return True
 
 class Popen(subprocess.Popen):
     """
@@ -67,12 +88,9 @@ class Popen(subprocess.Popen):
             # 0 even without WNOHANG in odd situations.  issue14396.
             if pid == self.pid:
                 self._handle_exitstatus(sts)
-            else:
-                try:
-                    _ = psutil.Process(self.pid)
-                except psutil.NoSuchProcess:
-                    print 'Process finished but wait4() returned a mismatched pid'
-                    self.returncode = 1
+            elif not pid_exists(self.pid):
+                print 'Process finished but wait4() returned a mismatched pid'
+                self.returncode = 1
 
         if self.returncode == -signal.SIGSEGV:
             print "SEGMENTATION FAULT"
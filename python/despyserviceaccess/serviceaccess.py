@@ -11,7 +11,6 @@
 
 import os
 import time
-import subprocess
 import ConfigParser
 
 class ServiceaccessException(Exception):
@@ -32,6 +31,55 @@ class ServiceaccessException(Exception):
 
 expectedkeys = ("meta_section", "meta_file")
 
+# parsed service access files, file name -> ((mtime, size), {section: {key: value}}),
+# so repeated lookups in a process don't re-read an unchanged file
+parsed_files = {}
+
+def read_simple_ini(file_name):
+    """ Read a service access file with the plain ``[section]`` and
+        ``key = value`` lines they normally contain, in one pass.
+
+        Parameters
+        ----------
+        file_name : str
+            The name of the service access file to read.
+
+        Returns
+        -------
+        dict
+            Dictionary of sections, each a dictionary of the key-value pairs
+            (keys lowercased as done by ConfigParser).  ``None`` if the file
+            uses any syntax not handled here (continuation lines, DEFAULT
+            section, inline comments, ...) and so needs ConfigParser.
+    """
+    sections = {}
+    cursect = None
+    with open(file_name) as fh:
+        for line in fh:
+            line = line.rstrip('\r\n')
+            if not line.strip() or line[0] in '#;':
+                continue
+            if line[0].isspace() or line[:3].lower() == 'rem':
+                return None
+            if line[0] == '[':
+                end = line.find(']')
+                if end < 2 or line[1:end] == ConfigParser.DEFAULTSECT:
+                    return None
+                cursect = sections.setdefault(line[1:end], {})
+                continue
+
+            seps = [i for i in (line.find('='), line.find(':')) if i != -1]
+            if cursect is None or not seps:
+                return None
+            sep = min(seps)
+            key = line[:sep].strip().lower()
+            value = line[sep+1:].strip()
+            if not key or ';' in value or value == '""':
+                return None
+            cursect[key] = value
+    return sections
+
+
 def parse(file_name, section, tag=None, retry=False):
     """ Parse a serviceaccess file, return a dictionary of key values pairs
         containing the entries. See :ref:`serviceaccessDescription` for
@@ -94,33 +142,41 @@ def parse(file_name, section, tag=None, retry=False):
     while not success and trycnt <= maxtries:
         trycnt += 1
         try:
-            open(file_name)
+            open(file_name).close()
             success = True
         except IOError as exc:
             if trycnt < maxtries:
                 print "IOError: %s" % exc
                 print "Sleeping for %s seconds and retrying" % delay
                 try:
-                    # try triggering automount
-                    process = subprocess.Popen(['ls', '-l', file_name], shell=False,
-                                               stdout=subprocess.PIPE,
-                                               stderr=subprocess.STDOUT)
-                    process.wait()
-                    #print process.communicate()
-                except Exception:
-                    pass
+                    # try triggering automount, looking up the file does it
+                    # on most automounters, listing the directory on the rest
+                    os.stat(file_name)
+                except OSError:
+                    try:
+                        os.listdir(os.path.dirname(file_name) or '.')
+                    except OSError:
+                        pass
                 time.sleep(delay)
             else:
                 raise
 
-    c = ConfigParser.RawConfigParser()
-    c.read(file_name)
-    d = {}
-    [d.__setitem__(key, value) for (key, value) in c.items(section)]
-    d["meta_file"] = file_name
-    d["meta_section"] = section
-
-    return d
+    fstat = os.stat(file_name)
+    stamp = (fstat.st_mtime, fstat.st_size)
+    cached = parsed_files.get(file_name)
+    if cached is not None and cached[0] == stamp:
+        sections = cached[1]
+    else:
+        sections = read_simple_ini(file_name)
+        if sections is None:
+            c = ConfigParser.RawConfigParser()
+            c.read(file_name)
+            sections = dict((sect, dict(c.items(sect))) for sect in c.sections())
+        parsed_files[file_name] = (stamp, sections)
+
+    if section not in sections:
+        raise ConfigParser.NoSectionError(section)
+    return dict(sections[section], meta_file=file_name, meta_section=section)
 
 def check(d):
     """ Perform a basic check on the file permission to make sure that the file being read
@@ -14,24 +14,30 @@ import shutil
 import threading
 import copy
 from io import BytesIO
+from multiprocessing.pool import ThreadPool
 from re import sub
 
 import lxml.etree as etree
 import requests
+from requests.adapters import HTTPAdapter
+from requests.packages.urllib3.util.retry import Retry
 
 from deswebdav.connection import WebDAVSettings, ProxySettings
 import deswebdav.exceptions as exceptions
 from deswebdav.urn import Urn
 
 try:
-    from urllib.parse import unquote, urlsplit
+    from urllib.parse import quote, unquote, urlsplit
 except ImportError:
-    from urllib import unquote
+    from urllib import quote, unquote
     from urlparse import urlsplit
 
 __version__ = "0.2"
 log = logging.getLogger(__name__)
 
+# size of the reads and writes when streaming a file to or from the server
+TRANSFER_BLOCK_SIZE = 1024 * 1024
+
 
 def listdir(directory):
     """ Returns list of nested files and directories for local directory by path
@@ -86,6 +92,22 @@ def get_options(option_type, from_options):
     return _options
 
 
+def parse_headers(headers):
+    """ Turns HTTP header lines into a dictionary
+
+        Parameters
+        ----------
+        headers : list
+            The headers as ``"Name: value"`` strings, the value may itself contain ``:``
+
+        Returns
+        -------
+        dict
+            The header values keyed by name.
+    """
+    return dict((name.strip(), value.strip()) for (name, _, value) in (header.partition(':') for header in headers))
+
+
 def wrap_connection_error(fn):
     """ Wrapper for a connection error
 
@@ -120,6 +142,17 @@ class Client(object):
     # controls whether to verify the server's TLS certificate or not
     verify = True
 
+    # number of connections to the server kept open for reuse, also the number of
+    # files transferred at once by download_directory and upload_directory
+    pool_size = 8
+
+    # number of times to retry a request which could not connect to the server
+    connect_retries = 3
+
+    # whether to check that a resource (or its parent) exists with separate requests before
+    # operating on it, otherwise the error status of the operation itself is used
+    pre_check = False
+
     # HTTP headers for different actions
     http_header = {
         'list': ["Accept: */*", "Depth: 1"],
@@ -134,6 +167,9 @@ class Client(object):
         'set_property': ["Accept: */*", "Depth: 1", "Content-Type: application/x-www-form-urlencoded"]
     }
 
+    # http_header entries already parsed into dictionaries, by action
+    parsed_http_header = {}
+
     def get_headers(self, action, headers_ext=None):
         """ Returns HTTP headers of specified WebDAV actions.
 
@@ -151,21 +187,15 @@ class Client(object):
             dict
                 The dictionary of headers for specified action.
         """
-        if action in Client.http_header:
-            try:
-                headers = Client.http_header[action].copy()
-            except AttributeError:
-                headers = Client.http_header[action][:]
-        else:
-            headers = list()
+        headers = Client.parsed_http_header.get(action)
+        if headers is None:
+            headers = parse_headers(Client.http_header.get(action, []))
+            Client.parsed_http_header[action] = headers
 
+        headers = dict(headers)
         if headers_ext:
-            headers.extend(headers_ext)
-
-        if self.webdav.token:
-            webdav_token = "Authorization: OAuth {token}".format(token=self.webdav.token)
-            headers.append(webdav_token)
-        return dict([map(lambda s: s.strip(), i.split(':')) for i in headers])
+            headers.update(parse_headers(headers_ext))
+        return headers
 
     def get_url(self, path):
         """ Generates url by uri path.
@@ -222,21 +252,88 @@ class Client(object):
             request.response
                 HTTP response of request.
         """
-        response = requests.request(
+        # transfer_files threads each have a session of their own
+        session = getattr(self.thread_state, 'session', None)
+        response = (session or self.session).request(
             method=Client.requests[action],
             url=self.get_url(path),
-            auth=(self.webdav.login, self.webdav.password),
             headers=self.get_headers(action, headers_ext),
             timeout=self.timeout,
             data=data,
-            stream=True,
-            verify=self.verify
+            stream=True
         )
         if response.status_code == 507:
             raise exceptions.NotEnoughSpace()
-        self.lastResponse = copy.deepcopy(response)
+        if action not in Client.streamed_actions:
+            # read the (small) body now, which returns the connection to the pool
+            # pylint: disable=pointless-statement
+            response.content
+        # the last response is the calling thread's, not one of a transfer_files thread
+        if session is None:
+            self.lastResponse = response
         return response
 
+    def raise_for_missing(self, response, path, target_path=None):
+        """ Raises the exception for a response whose status shows that the resource, or
+            the parent of the target, does not exist, as the checks done by `pre_check`
+            would have.
+
+            Parameters
+            ----------
+            response : requests.Response
+                The response to check.
+
+            path : str
+                The path to the resource the request was for.
+
+            target_path : str, optional
+                The path to the resource being created (e.g. the destination of a copy),
+                defaults to `path`.
+
+            Raises
+            ------
+            RemoteResourceNotFound
+                If the status is 404 (Not Found).
+
+            RemoteParentNotFound
+                If the status is 409 (Conflict), which is given when a parent is missing.
+        """
+        if response.status_code not in (404, 409):
+            return
+        # read the error body so the connection can be reused
+        # pylint: disable=pointless-statement
+        response.content
+        if response.status_code == 404:
+            raise exceptions.RemoteResourceNotFound(path)
+        raise exceptions.RemoteParentNotFound(target_path or path)
+
+    def raise_for_error(self, response, path):
+        """ Raises an exception for any error status of a download, so the error page
+            does not get saved as the file.
+
+            Parameters
+            ----------
+            response : requests.Response
+                The response to check.
+
+            path : str
+                The path to the file being downloaded.
+
+            Raises
+            ------
+            RemoteResourceNotFound
+                If the status is 404 (Not Found).
+
+            ResponseErrorCode
+                For any other status of 400 or more.
+        """
+        self.raise_for_missing(response, path)
+        if response.status_code >= 400:
+            # pylint: disable=pointless-statement
+            response.content
+            raise exceptions.ResponseErrorCode(url=response.url, code=response.status_code,
+                                               message=response.reason)
+
     # mapping of actions to WebDAV methods
     requests = {
         'download': "GET",
@@ -256,6 +353,9 @@ class Client(object):
         'set_property': "PROPPATCH"
     }
 
+    # actions whose response body is left to the caller to read from response.raw
+    streamed_actions = ('download', 'list', 'info')
+
     meta_xmlns = {
         'https://webdav.yandex.ru': "urn:yandex:disk:meta",
     }
@@ -287,6 +387,11 @@ class Client(object):
                                port. Example: `https://proxy.server.com:8383`.
                 * `proxy_login`: login name for proxy server.
                 * `proxy_password`: password for proxy server.
+
+                All requests go through the requests.Session in `self.session`, which holds the
+                credentials, certificate verification and proxies (`self.session.proxies`) set here.
+                The threads of transfer_files each use a copy of it, as requests doesn't promise
+                a Session can be shared between threads.
         """
         webdav_options = get_options(option_type=WebDAVSettings, from_options=options)
         proxy_options = get_options(option_type=ProxySettings, from_options=options)
@@ -296,6 +401,46 @@ class Client(object):
         self.default_options = {}
         self.lastResponse = None
         self.cwd = '/'
+        self.session = self.create_session()
+        # per thread state of the transfer_files threads
+        self.thread_state = threading.local()
+
+        # remote directories known to exist, so mkdirs does not make them again
+        self.existing_directories = set()
+
+    def create_session(self):
+        """ Create the session used for all requests to the server, so that the
+            connections (and TLS handshakes) are reused instead of being made anew
+            for every request.
+
+            Returns
+            -------
+            requests.Session
+                The session, with the authentication, verification and proxy settings applied.
+        """
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=self.pool_size, pool_maxsize=self.pool_size,
+                              max_retries=Retry(total=self.connect_retries, read=0, backoff_factor=0.5))
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+
+        # an auth tuple replaces any Authorization header, so only one of them is used
+        if self.webdav.login:
+            session.auth = (self.webdav.login, self.webdav.password)
+        elif self.webdav.token:
+            session.headers['Authorization'] = "OAuth {token}".format(token=self.webdav.token)
+        session.verify = self.verify
+
+        if self.proxy.hostname:
+            proxy = urlsplit(self.proxy.hostname)
+            netloc = proxy.netloc
+            if self.proxy.login:
+                netloc = "{login}:{password}@{netloc}".format(login=quote(self.proxy.login, safe=''),
+                                                             password=quote(self.proxy.password, safe=''),
+                                                             netloc=netloc)
+            proxy_url = "{scheme}://{netloc}".format(scheme=proxy.scheme or 'http', netloc=netloc)
+            session.proxies = {'http': proxy_url, 'https': proxy_url}
+        return session
 
     def getresponse(self):
         """ Get the last response
@@ -357,15 +502,20 @@ class Client(object):
                 List of nested file or directory names.
         """
         directory_urn = Urn(remote_path, directory=True)
-        if directory_urn.path() != Client.root:
+        if self.pre_check and directory_urn.path() != Client.root:
             if not self.check(directory_urn.path()):
                 raise exceptions.RemoteResourceNotFound(directory_urn.path())
 
         response = self.execute_request(action='list', path=directory_urn.quote())
-        urns = WebDavXmlUtils.parse_get_list_response(response.content)
+        self.raise_for_missing(response, directory_urn.path())
+        response.raw.decode_content = True
+        urns = WebDavXmlUtils.parse_get_list_response(response.raw)
 
         path = Urn.normalize_path(self.get_full_path(directory_urn))
-        return [urn.filename() for urn in urns if Urn.compare_path(path, urn.path()) is False]
+        names = [urn.filename() for urn in urns if Urn.compare_path(path, urn.path()) is False]
+        self.existing_directories.add(directory_urn.path())
+        self.existing_directories.update(directory_urn.path() + name for name in names if name.endswith(Urn.separate))
+        return names
 
     @wrap_connection_error
     def free(self):
@@ -427,11 +577,28 @@ class Client(object):
         """
         expected_codes = (200, 201) if not safe else (201, 301, 405)
         directory_urn = Urn(remote_path, directory=True)
-        if not self.check(directory_urn.parent()):
+        if self.pre_check and not self.check(directory_urn.parent()):
             raise exceptions.RemoteParentNotFound(directory_urn.path())
 
         response = self.execute_request(action='mkdir', path=directory_urn.quote())
-        return response.status_code in expected_codes
+        if response.status_code == 409:
+            raise exceptions.RemoteParentNotFound(directory_urn.path())
+        if response.status_code in expected_codes:
+            self.existing_directories.add(directory_urn.path())
+            return True
+        return False
+
+    def forget_directories(self, remote_path):
+        """ Drops a removed (or moved) remote directory and everything below it from the
+            directories known to exist.
+
+            Parameters
+            ----------
+            remote_path : str
+                Path to the directory (or file) which no longer exists.
+        """
+        prefix = Urn(remote_path, directory=True).path()
+        self.existing_directories.difference_update([d for d in self.existing_directories if d.startswith(prefix)])
 
     @wrap_connection_error
     def cd(self, path):
@@ -455,29 +622,27 @@ class Client(object):
 
     @wrap_connection_error
     def mkdirs(self, path):
-        """ Recursively make directories
+        """ Recursively make directories, skipping those already known to exist
 
             Parameters
             ----------
             path : str
-                The path to make
+                The path to make, relative to the current directory unless it starts with ``/``
         """
         dirs = [d for d in path.split('/') if d]
         if not dirs:
             return
-        if path.startswith('/'):
-            dirs[0] = '/' + dirs[0]
-        old_cwd = self.cwd
-        try:
-            for d in dirs:
-                try:
-                    if not self.mkdir(d, safe=True):
-                        if self.getstatus() == 409:
-                            raise requests.RequestException("Return code 409 received, there is an unspecified conflict between this machine and the remote server.")
-                finally:
-                    self.cd(dir)
-        finally:
-            self.cd(old_cwd)
+        current = Client.root if path.startswith('/') else self.cwd
+        for d in dirs:
+            # MKCOL each level in turn (parents first), an existing one just gives 405
+            current = Urn(current + d, directory=True).path()
+            if current in self.existing_directories:
+                continue
+            response = self.execute_request(action='mkdir', path=Urn(current, directory=True).quote())
+            if response.status_code in (200, 201, 301, 405):
+                self.existing_directories.add(current)
+            elif response.status_code == 409:
+                raise requests.RequestException("Return code 409 received, there is an unspecified conflict between this machine and the remote server.")
 
     @wrap_connection_error
     def download_from(self, buff, remote_path):
@@ -492,14 +657,16 @@ class Client(object):
                 Path to file on WebDAV server.
         """
         urn = Urn(remote_path)
-        if self.is_dir(urn.path()):
+        if urn.is_dir() or (self.pre_check and self.is_dir(urn.path())):
             raise exceptions.OptionNotValid(name="remote_path", value=remote_path)
 
-        if not self.check(urn.path()):
+        if self.pre_check and not self.check(urn.path()):
             raise exceptions.RemoteResourceNotFound(urn.path())
 
         response = self.execute_request(action='download', path=urn.quote())
-        shutil.copyfileobj(response.raw, buff)
+        self.raise_for_error(response, urn.path())
+        response.raw.decode_content = True
+        shutil.copyfileobj(response.raw, buff, TRANSFER_BLOCK_SIZE)
 
     def download(self, remote_path, local_path):
         """ Downloads remote resource from WebDAV and save it in local path.
@@ -539,10 +706,24 @@ class Client(object):
 
         os.makedirs(local_path)
 
-        for resource_name in self.list(urn.path()):
-            _remote_path = "{parent}{name}".format(parent=urn.path(), name=resource_name)
-            _local_path = os.path.join(local_path, resource_name)
-            self.download(local_path=_local_path, remote_path=_remote_path)
+        # make the whole directory tree first (list marks directories with a trailing
+        # separator), then download the files concurrently
+        files = []
+        directories = [(urn.path(), local_path)]
+        while directories:
+            (remote_dir, local_dir) = directories.pop()
+            for resource_name in self.list(remote_dir):
+                _remote_path = "{parent}{name}".format(parent=remote_dir, name=resource_name)
+                _local_path = os.path.join(local_dir, resource_name)
+                # not every server marks directories with a trailing separator,
+                # so ask about the names that don't have one
+                if resource_name.endswith(Urn.separate) or self.is_dir(_remote_path):
+                    os.makedirs(_local_path)
+                    directories.append((Urn(_remote_path, directory=True).path(), _local_path))
+                else:
+                    files.append((_remote_path, _local_path))
+
+        self.transfer_files(self.download_file, files)
 
     @wrap_connection_error
     def download_file(self, remote_path, local_path):
@@ -558,19 +739,28 @@ class Client(object):
                 The path to save file locally.
         """
         urn = Urn(remote_path)
-        if self.is_dir(urn.path()):
+        if urn.is_dir() or (self.pre_check and self.is_dir(urn.path())):
             raise exceptions.OptionNotValid(name="remote_path", value=remote_path)
 
         if os.path.isdir(local_path):
             raise exceptions.OptionNotValid(name="local_path", value=local_path)
 
-        if not self.check(urn.path()):
+        if self.pre_check and not self.check(urn.path()):
             raise exceptions.RemoteResourceNotFound(urn.path())
 
-        with open(local_path, 'wb') as local_file:
-            response = self.execute_request('download', urn.quote())
-            for block in response.iter_content(1024):
-                local_file.write(block)
+        response = self.execute_request('download', urn.quote())
+        self.raise_for_error(response, urn.path())
+        try:
+            with open(local_path, 'wb') as local_file:
+                # copy in large blocks straight from the connection, undoing any
+                # content encoding as iter_content would
+                response.raw.decode_content = True
+                shutil.copyfileobj(response.raw, local_file, TRANSFER_BLOCK_SIZE)
+        except:
+            # don't leave a partial file that looks like a finished download
+            if os.path.exists(local_path):
+                os.remove(local_path)
+            raise
 
     def download_sync(self, remote_path, local_path, callback=None):
         """ Downloads remote resources from WebDAV server synchronously.
@@ -624,10 +814,11 @@ class Client(object):
         if urn.is_dir():
             raise exceptions.OptionNotValid(name="remote_path", value=remote_path)
 
-        if not self.check(urn.parent()):
+        if self.pre_check and not self.check(urn.parent()):
             raise exceptions.RemoteParentNotFound(urn.path())
 
-        self.execute_request(action='upload', path=urn.quote(), data=buff)
+        response = self.execute_request(action='upload', path=urn.quote(), data=buff)
+        self.raise_for_missing(response, urn.path())
 
     def upload(self, remote_path, local_path):
         """ Uploads resource to remote path on WebDAV server.
@@ -673,10 +864,72 @@ class Client(object):
 
         self.mkdir(remote_path)
 
-        for resource_name in listdir(local_path):
-            _remote_path = "{parent}{name}".format(parent=urn.path(), name=resource_name)
-            _local_path = os.path.join(local_path, resource_name)
-            self.upload(local_path=_local_path, remote_path=_remote_path)
+        # make the whole directory tree first, then upload the files concurrently
+        files = []
+        directories = [(urn.path(), local_path)]
+        while directories:
+            (remote_dir, local_dir) = directories.pop()
+            for resource_name in listdir(local_dir):
+                _remote_path = "{parent}{name}".format(parent=remote_dir, name=resource_name)
+                _local_path = os.path.join(local_dir, resource_name)
+                if os.path.isdir(_local_path):
+                    self.mkdir(_remote_path)
+                    directories.append((_remote_path, _local_path))
+                else:
+                    files.append((_remote_path, _local_path))
+
+        self.transfer_files(self.upload_file, files)
+
+    def transfer_files(self, transfer, paths):
+        """ Transfer several files at once, up to `pool_size` of them in flight, each thread
+            with its own copy of `self.session`.  They leave `lastResponse` alone.
+
+            Parameters
+            ----------
+            transfer : function
+                The method doing a single transfer, download_file or upload_file.
+
+            paths : list
+                (remote_path, local_path) tuples, one per file to transfer.
+
+            Raises
+            ------
+            Exception
+                The exception from the first failed transfer (in the order of `paths`), no
+                further transfers are started after it.
+        """
+        if not paths:
+            return
+
+        sessions = []
+
+        def init_thread():
+            """ Give the pool thread a session made like self.session """
+            session = self.create_session()
+            session.auth = self.session.auth
+            session.headers = copy.copy(self.session.headers)
+            session.proxies = copy.copy(self.session.proxies)
+            session.verify = self.session.verify
+            session.cert = self.session.cert
+            self.thread_state.session = session
+            sessions.append(session)
+
+        # the transfers spend their time waiting on the network, so threads are enough
+        pool = ThreadPool(min(self.pool_size, len(paths)), initializer=init_thread)
+        try:
+            results = [pool.apply_async(transfer, kwds={'remote_path': remote_path, 'local_path': local_path})
+                       for (remote_path, local_path) in paths]
+            for result in results:
+                result.get()
+        except:
+            pool.terminate()
+            raise
+        else:
+            pool.close()
+        finally:
+            pool.join()
+            for session in sessions:
+                session.close()
 
     @wrap_connection_error
     def upload_file(self, remote_path, local_path):
@@ -701,11 +954,12 @@ class Client(object):
         if os.path.isdir(local_path):
             raise exceptions.OptionNotValid(name="local_path", value=local_path)
 
-        if not self.check(urn.parent()):
+        if self.pre_check and not self.check(urn.parent()):
             raise exceptions.RemoteParentNotFound(urn.path())
 
         with open(local_path, "rb") as local_file:
-            self.execute_request(action='upload', path=urn.quote(), data=local_file)
+            response = self.execute_request(action='upload', path=urn.quote(), data=local_file)
+        self.raise_for_missing(response, urn.path())
 
     def upload_sync(self, remote_path, local_path, callback=None):
         """ Uploads resource to remote path on WebDAV server synchronously.
@@ -762,16 +1016,19 @@ class Client(object):
                 Folder depth to copy, default is 1.
         """
         urn_from = Urn(remote_path_from)
-        if not self.check(urn_from.path()):
-            raise exceptions.RemoteResourceNotFound(urn_from.path())
-
         urn_to = Urn(remote_path_to)
-        if not self.check(urn_to.parent()):
-            raise exceptions.RemoteParentNotFound(urn_to.path())
+        if self.pre_check:
+            if not self.check(urn_from.path()):
+                raise exceptions.RemoteResourceNotFound(urn_from.path())
+
+            if not self.check(urn_to.parent()):
+                raise exceptions.RemoteParentNotFound(urn_to.path())
 
         header_destination = "Destination: {path}".format(path=self.get_full_path(urn_to))
         header_depth = "Depth: {depth}".format(depth=depth)
-        self.execute_request(action='copy', path=urn_from.quote(), headers_ext=[header_destination, header_depth])
+        response = self.execute_request(action='copy', path=urn_from.quote(),
+                                        headers_ext=[header_destination, header_depth])
+        self.raise_for_missing(response, urn_from.path(), urn_to.path())
 
     @wrap_connection_error
     def move(self, remote_path_from, remote_path_to, overwrite=False):
@@ -790,16 +1047,20 @@ class Client(object):
                 Overwrite file if it exists. Defaults is False
         """
         urn_from = Urn(remote_path_from)
-        if not self.check(urn_from.path()):
-            raise exceptions.RemoteResourceNotFound(urn_from.path())
-
         urn_to = Urn(remote_path_to)
-        if not self.check(urn_to.parent()):
-            raise exceptions.RemoteParentNotFound(urn_to.path())
+        if self.pre_check:
+            if not self.check(urn_from.path()):
+                raise exceptions.RemoteResourceNotFound(urn_from.path())
+
+            if not self.check(urn_to.parent()):
+                raise exceptions.RemoteParentNotFound(urn_to.path())
 
         header_destination = "Destination: {path}".format(path=self.get_full_path(urn_to))
         header_overwrite = "Overwrite: {flag}".format(flag="T" if overwrite else "F")
-        self.execute_request(action='move', path=urn_from.quote(), headers_ext=[header_destination, header_overwrite])
+        response = self.execute_request(action='move', path=urn_from.quote(),
+                                        headers_ext=[header_destination, header_overwrite])
+        self.raise_for_missing(response, urn_from.path(), urn_to.path())
+        self.forget_directories(urn_from.path())
 
     @wrap_connection_error
     def clean(self, remote_path):
@@ -814,6 +1075,7 @@ class Client(object):
         """
         urn = Urn(remote_path)
         self.execute_request(action='clean', path=urn.quote())
+        self.forget_directories(urn.path())
 
     @wrap_connection_error
     def info(self, remote_path):
@@ -835,12 +1097,14 @@ class Client(object):
                 * `modified`: date of resource modification.
         """
         urn = Urn(remote_path)
-        if not self.check(urn.path()) and not self.check(Urn(remote_path, directory=True).path()):
+        if self.pre_check and not self.check(urn.path()) and not self.check(Urn(remote_path, directory=True).path()):
             raise exceptions.RemoteResourceNotFound(remote_path)
 
         response = self.execute_request(action='info', path=urn.quote())
+        self.raise_for_missing(response, remote_path)
+        response.raw.decode_content = True
         path = self.get_full_path(urn)
-        return WebDavXmlUtils.parse_info_response(content=response.content, path=path, hostname=self.webdav.hostname)
+        return WebDavXmlUtils.parse_info_response(content=response.raw, path=path, hostname=self.webdav.hostname)
 
     @wrap_connection_error
     def is_dir(self, remote_path):
@@ -859,12 +1123,15 @@ class Client(object):
         """
         urn = Urn(remote_path)
         parent_urn = Urn(urn.parent())
-        if not self.check(urn.path()) and not self.check(Urn(remote_path, directory=True).path()):
+        if self.pre_check and not self.check(urn.path()) and not self.check(Urn(remote_path, directory=True).path()):
             raise exceptions.RemoteResourceNotFound(remote_path)
 
+        # a missing resource is not in its parent's listing (or the parent is missing)
         response = self.execute_request(action='info', path=parent_urn.quote())
+        self.raise_for_missing(response, remote_path)
+        response.raw.decode_content = True
         path = self.get_full_path(urn)
-        return WebDavXmlUtils.parse_is_dir_response(content=response.content, path=path, hostname=self.webdav.hostname)
+        return WebDavXmlUtils.parse_is_dir_response(content=response.raw, path=path, hostname=self.webdav.hostname)
 
     @wrap_connection_error
     def get_property(self, remote_path, option):
@@ -1290,14 +1557,39 @@ class WebDavXmlUtils(object):
     def __init__(self):
         pass
 
+    @staticmethod
+    def iter_responses(content):
+        """ Iterates over the response elements of a multistatus XML document, parsing it
+            incrementally so that the whole document is never held in memory. Each element
+            is cleared when the next one is requested.
+
+            Parameters
+            ----------
+            content : str or file
+                The XML content of HTTP response from WebDAV server, or a file-like object
+                (e.g. the raw HTTP response) to read it from.
+
+            Returns
+            -------
+            generator
+                The ``{DAV:}response`` elements, in document order.
+        """
+        source = BytesIO(content) if isinstance(content, bytes) else content
+        for _, elem in etree.iterparse(source, events=('end',), tag='{DAV:}response'):
+            yield elem
+            elem.clear()
+            while elem.getprevious() is not None:
+                del elem.getparent()[0]
+
     @staticmethod
     def parse_get_list_response(content):
         """ Parses of response content XML from WebDAV server and extract file and directory names.
 
             Parameters
             ----------
-            content : str
-                The XML content of HTTP response from WebDAV server for getting list of files by remote path.
+            content : str or file
+                The XML content of HTTP response from WebDAV server for getting list of files by remote path,
+                or a file-like object to read it from.
 
             Returns
             -------
@@ -1305,9 +1597,8 @@ class WebDavXmlUtils(object):
                 List of extracted file or directory names.
         """
         try:
-            tree = etree.fromstring(content)
-            hrees = [Urn.separate + unquote(urlsplit(hree.text).path) for hree in tree.findall(".//{DAV:}href")]
-            return [Urn(hree) for hree in hrees]
+            return [Urn(Urn.separate + unquote(urlsplit(resp.findtext("{DAV:}href")).path))
+                    for resp in WebDavXmlUtils.iter_responses(content)]
         except etree.XMLSyntaxError:
             return list()
 
@@ -1362,8 +1653,8 @@ class WebDavXmlUtils(object):
 
             Parameters
             ----------
-            content : str
-                The XML content of HTTP response from WebDAV server.
+            content : str or file
+                The XML content of HTTP response from WebDAV server, or a file-like object to read it from.
 
             path : str
                 The path to resource.
@@ -1399,8 +1690,8 @@ class WebDavXmlUtils(object):
 
             Parameters
             ----------
-            content : str
-                The XML content of HTTP response from WebDAV server.
+            content : str or file
+                The XML content of HTTP response from WebDAV server, or a file-like object to read it from.
 
             path : str
                 The path to resource.
@@ -1516,8 +1807,8 @@ class WebDavXmlUtils(object):
 
             Parameters
             ----------
-            content : str
-                Raw content of response as string.
+            content : str or file
+                Raw content of response as string, or a file-like object to read it from.
 
             path : str
                 The path to needed remote resource.
@@ -1531,16 +1822,15 @@ class WebDavXmlUtils(object):
                 XML object of response for the remote resource defined by path.
         """
         try:
-            tree = etree.fromstring(content)
-            responses = tree.findall("{DAV:}response")
-
             n_path = Urn.normalize_path(path)
 
-            for resp in responses:
-                href = resp.findtext("{DAV:}href")
-
-                if Urn.compare_path(n_path, href) is True:
-                    return resp
-            raise exceptions.RemoteResourceNotFound(path)
+            # read the document to the end, keeping only the matching response
+            found = None
+            for resp in WebDavXmlUtils.iter_responses(content):
+                if found is None and Urn.compare_path(n_path, resp.findtext("{DAV:}href")) is True:
+                    found = copy.deepcopy(resp)
+            if found is None:
+                raise exceptions.RemoteResourceNotFound(path)
+            return found
         except etree.XMLSyntaxError:
             raise exceptions.MethodNotSupported(name="is_dir", server=hostname)
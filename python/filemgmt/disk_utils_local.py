@@ -166,6 +166,41 @@ def get_file_disk_info_path(path, save_md5sum=False):
 
     return fileinfo
 
+######################################################################
+def copyfile_fast(src, dst, blksize=2**21):
+    """ Same as shutil.copy, but copies the data in the kernel with
+        os.sendfile where available, else through a larger buffer
+
+        Parameters
+        ----------
+        src : str
+            The file to copy
+
+        dst : str
+            The name of the copy
+
+        blksize : int
+            The most bytes moved per call, default is 2**21
+    """
+    with open(src, 'rb') as fsrc:
+        with open(dst, 'wb') as fdst:
+            if hasattr(os, 'sendfile'):
+                try:
+                    offset = 0
+                    while True:
+                        sent = os.sendfile(fdst.fileno(), fsrc.fileno(), offset, blksize)
+                        if sent == 0:
+                            break
+                        offset += sent
+                except OSError as exc:
+                    # e.g., filesystems that don't support it, nothing written yet
+                    if offset != 0 or exc.errno not in (errno.EINVAL, errno.ENOSYS, errno.ENOTSUP):
+                        raise
+                    shutil.copyfileobj(fsrc, fdst, blksize)
+            else:
+                shutil.copyfileobj(fsrc, fdst, blksize)
+    shutil.copymode(src, dst)
+
 ######################################################################
 def copyfiles(filelist, tstats, verify=False):
     """ Copies files in given src,dst in filelist
@@ -207,7 +242,7 @@ def copyfiles(filelist, tstats, verify=False):
                 path = os.path.dirname(dst)
                 if path and not os.path.exists(path):
                     miscutils.coremakedirs(path)
-                shutil.copy(src, dst)
+                copyfile_fast(src, dst)
                 if tstats is not None:
                     tstats.stat_end_file(0, fsize)
                 if verify:
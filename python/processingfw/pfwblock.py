@@ -32,6 +32,11 @@ import intgutils.queryutils as queryutils
 import processingfw.pfwdefs as pfwdefs
 import processingfw.pfwutils as pfwutils
 
+FMT_COLUMN_RE = re.compile(r'\$FMT\{\s*([^,]+)\s*,\s*(\S+)\s*\}')
+FMT_INT_RE = re.compile(r'%\d*d')
+FMT_FLOAT_RE = re.compile(r'%\d*(.\d+)f')
+LIST_SEPARATORS = {'textcsv': ', ', 'texttab': '\t'}
+
 #######################################################################
 def get_datasect_types(config, modname):
     """ tell which data sections (files, lists) are inputs vs outputs """
@@ -813,19 +818,16 @@ def output_line(listfh, line, lineformat, allow_missing, keyarr):
 
     lineformat = lineformat.lower()
 
-    if lineformat == 'config' or lineformat == 'wcl':
-        listfh.write("<file>\n")
-
-    numkeys = len(keyarr)
-    for i in range(0, numkeys):
-        key = keyarr[i]
+    # format the whole line and write it once
+    fields = []
+    for key in keyarr:
         value = None
         if miscutils.fwdebug_check(6, "PFWBLOCK_DEBUG"):
             miscutils.fwdebug_print("key: %s" % key)
 
         valuefmt = None
         if key.startswith('$FMT{'):
-            rmatch = re.match(r'\$FMT\{\s*([^,]+)\s*,\s*(\S+)\s*\}', key)
+            rmatch = FMT_COLUMN_RE.match(key)
             if rmatch:
                 valuefmt = rmatch.group(1).strip()
                 key = rmatch.group(2).strip()
@@ -860,47 +862,35 @@ def output_line(listfh, line, lineformat, allow_missing, keyarr):
         else:
             value = get_value_from_line(line, key, None, 1)
 
-        # handle last field (separate to avoid trailing comma)
         if miscutils.fwdebug_check(6, "PFWBLOCK_DEBUG"):
             miscutils.fwdebug_print("printing key=%s value=%s" % (key, value))
-        if i == numkeys - 1:
-            print_value(listfh, key, value, lineformat, True, valuefmt)
-        else:
-            print_value(listfh, key, value, lineformat, False, valuefmt)
+        fields.append(format_value(key, value, lineformat, valuefmt))
 
     if lineformat == "config" or lineformat == 'wcl':
-        listfh.write("</file>\n")
+        listfh.write("<file>\n%s</file>\n" % ''.join(fields))
     else:
-        listfh.write("\n")
+        # separators only between fields to avoid trailing comma
+        listfh.write(LIST_SEPARATORS.get(lineformat, ' ').join(fields) + "\n")
 
 
 #####################################################################
-def print_value(outfh, key, value, lineformat, last, valuefmt):
-    """ output value to input list in correct format """
+def format_value(key, value, lineformat, valuefmt):
+    """ return value formatted for the input list (lineformat already lowercase) """
 
     if miscutils.fwdebug_check(6, "PFWBLOCK_DEBUG"):
         miscutils.fwdebug_print("BEG %s=%s (%s)" % (key, value, type(value)))
 
     if valuefmt is not None:
-        if re.search(r'%\d*d', valuefmt):
+        if FMT_INT_RE.search(valuefmt):
             value = valuefmt % int(value)
-        elif re.search(r'%\d*(.\d+)f', valuefmt):
+        elif FMT_FLOAT_RE.search(valuefmt):
             value = valuefmt % float(value)
         else:
             value = valuefmt % value
 
-    lineformat = lineformat.lower()
     if lineformat == 'config' or lineformat == 'wcl':
-        outfh.write("     %s=%s\n" % (key, str(value)))
-    else:
-        outfh.write(str(value))
-        if not last:
-            if lineformat == 'textcsv':
-                outfh.write(', ')
-            elif lineformat == 'texttab':
-                outfh.write('\t')
-            else:
-                outfh.write(' ')
+        return "     %s=%s\n" % (key, str(value))
+    return str(value)
 
 
 
@@ -1147,7 +1137,8 @@ def write_jobwcl(config, jobkey, jobdict):
         for key in [pfwdefs.COMPRESSION_EXEC,
                     pfwdefs.COMPRESSION_ARGS,
                     pfwdefs.COMPRESSION_SUFFIX,
-                    pfwdefs.COMPRESSION_CLEANUP]:
+                    pfwdefs.COMPRESSION_CLEANUP,
+                    pfwdefs.COMPRESSION_THREADS]:
             if key in config:
                 jobwcl[key] = config.get(key)
 
@@ -2075,15 +2066,14 @@ def create_single_wrapper_wcl(config, modname, wrapinst):
                         cc = num
                         break
                 if cc != -1:
-                    fl = open(v['fullname'], 'r')
-                    rl = fl.readlines()
-                    for line in rl:
-                        temp = line.split()[cc]
-                        temp = temp.replace(',', '')
-                        if isoutlist:
-                            files['outfiles'].append(temp.split('[')[0])
-                        elif isinlist:
-                            files['infiles'].append(temp.split('[')[0])
+                    with open(v['fullname'], 'r') as fl:
+                        for line in fl:
+                            temp = line.split(None, cc+1)[cc]
+                            temp = temp.replace(',', '')
+                            if isoutlist:
+                                files['outfiles'].append(temp.split('[')[0])
+                            elif isinlist:
+                                files['infiles'].append(temp.split('[')[0])
 
         if miscutils.fwdebug_check(3, "PFWBLOCK_DEBUG"):
             miscutils.fwdebug_print("\tlist=%s" % wrapperwcl[pfwdefs.IW_LISTSECT])
@@ -10,10 +10,11 @@
 
 # reserved variables:  __UCFILE__ uncompressed file, __CFILE__ compressed file
 
-import copy
+import functools
 import shlex
 import os
 import subprocess
+from multiprocessing.pool import ThreadPool
 
 import despymisc.miscutils as miscutils
 import intgutils.replace_funcs as replfuncs
@@ -45,62 +46,96 @@ def run_compression_command(cmd, fname_compressed, max_try_cnt=1):
 
 
 ######################################################################
-def compress_files(listfullnames, compresssuffix, execname, argsorig, max_try_cnt=3, cleanup=True):
-    """ Compress given files """
+def compress_single_file(fname, compresssuffix, execname, argsorig, max_try_cnt=3, cleanup=True):
+    """ Compress a single file, returning (result dict, bytes before, bytes after) """
+
+    errstr = None
+    cmd = None
+    fname_compressed = None
+    returncode = 1
+    bytes_before = 0
+    bytes_after = 0
+    try:
+        if not os.path.exists(fname):
+            errstr = "Error: Uncompressed file does not exist (%s)" % fname
+            returncode = 1
+        else:
+            bytes_before = os.path.getsize(fname)
+            fname_compressed = fname + compresssuffix
+
+            # create command
+            args = replfuncs.replace_vars_single(argsorig,
+                                                 {'__UCFILE__': fname,
+                                                  '__CFILE__': fname_compressed},
+                                                 None)
+            cmd = '%s %s' % (execname, args)
+            if miscutils.fwdebug_check(3, 'PFWCOMPRESS_DEBUG'):
+                miscutils.fwdebug_print("compression command: %s" % cmd)
+
+            returncode = run_compression_command(cmd, fname_compressed, max_try_cnt)
+    except IOError as exc:
+        errstr = "I/O error({0}): {1}".format(exc.errno, exc.strerror)
+        returncode = 1
+
+    if returncode != 0:
+        errstr = "Compression failed with exit code %i" % returncode
+        # check for partial compressed output and remove
+        if fname_compressed is not None and os.path.exists(fname_compressed):
+            miscutils.fwdebug_print("Compression failed.  Removing compressed file.")
+            os.unlink(fname_compressed)
+    elif miscutils.convertBool(cleanup): # if successful, remove uncompressed if requested
+        os.unlink(fname)
+
+    if returncode == 0:
+        bytes_after = os.path.getsize(fname_compressed)
+    else:
+        bytes_after = bytes_before
+
+    # save exit code, cmd and new name
+    return ({'status': returncode,
+             'outname': fname_compressed,
+             'err': errstr,
+             'cmd': cmd}, bytes_before, bytes_after)
+
+
+######################################################################
+def compress_files(listfullnames, compresssuffix, execname, argsorig, max_try_cnt=3,
+                   cleanup=True, num_threads=1):
+    """ Compress given files, running up to num_threads compressions at once.
+        One at a time unless the caller passes the number of cpus it may
+        use, as only it knows what else runs alongside """
 
     if miscutils.fwdebug_check(3, 'PFWCOMPRESS_DEBUG'):
         miscutils.fwdebug_print("BEG num files to compress = %s" % (len(listfullnames)))
 
+    compress = functools.partial(compress_single_file,
+                                 compresssuffix=compresssuffix,
+                                 execname=execname,
+                                 argsorig=argsorig,
+                                 max_try_cnt=max_try_cnt,
+                                 cleanup=cleanup)
+
+    # the work is done by the external compression program so threads are
+    # enough to keep several running (callers may be daemonic pool workers,
+    # which cannot start child processes of their own)
+    num_threads = min(max(1, num_threads), len(listfullnames))
+    if num_threads > 1:
+        pool = ThreadPool(num_threads)
+        try:
+            allres = pool.map(compress, listfullnames)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        allres = [compress(fname) for fname in listfullnames]
+
     results = {}
     tot_bytes_before = 0
     tot_bytes_after = 0
-    for fname in listfullnames:
-        errstr = None
-        cmd = None
-        fname_compressed = None
-        returncode = 1
-        try:
-            if not os.path.exists(fname):
-                errstr = "Error: Uncompressed file does not exist (%s)" % fname
-                returncode = 1
-            else:
-                tot_bytes_before += os.path.getsize(fname)
-                fname_compressed = fname + compresssuffix
-
-                # create command
-                args = copy.deepcopy(argsorig)
-                args = replfuncs.replace_vars_single(args,
-                                                     {'__UCFILE__': fname,
-                                                      '__CFILE__': fname_compressed},
-                                                     None)
-                cmd = '%s %s' % (execname, args)
-                if miscutils.fwdebug_check(3, 'PFWCOMPRESS_DEBUG'):
-                    miscutils.fwdebug_print("compression command: %s" % cmd)
-
-                returncode = run_compression_command(cmd, fname_compressed, max_try_cnt)
-        except IOError as exc:
-            errstr = "I/O error({0}): {1}".format(exc.errno, exc.strerror)
-            returncode = 1
-
-        if returncode != 0:
-            errstr = "Compression failed with exit code %i" % returncode
-            # check for partial compressed output and remove
-            if os.path.exists(fname_compressed):
-                miscutils.fwdebug_print("Compression failed.  Removing compressed file.")
-                os.unlink(fname_compressed)
-        elif miscutils.convertBool(cleanup): # if successful, remove uncompressed if requested
-            os.unlink(fname)
-
-        if returncode == 0:
-            tot_bytes_after += os.path.getsize(fname_compressed)
-        else:
-            tot_bytes_after += os.path.getsize(fname)
-
-        # save exit code, cmd and new name
-        results[fname] = {'status': returncode,
-                          'outname': fname_compressed,
-                          'err': errstr,
-                          'cmd': cmd}
+    for fname, (fres, bytes_before, bytes_after) in zip(listfullnames, allres):
+        results[fname] = fres
+        tot_bytes_before += bytes_before
+        tot_bytes_after += bytes_after
 
     if miscutils.fwdebug_check(3, 'PFWCOMPRESS_DEBUG'):
         miscutils.fwdebug_print("END bytes %s => %s" % (tot_bytes_before, tot_bytes_after))
@@ -70,6 +70,7 @@ COMPRESSION_SUFFIX = 'compression_suffix'
 COMPRESSION_ARGS = 'compression_args'
 COMPRESSION_CLEANUP = 'compress_cleanup'
 COMPRESSION_CLEANUP_DEFAULT = True
+COMPRESSION_THREADS = 'compression_threads'
 COMPRESS_FILES = 'compress_files'
 
 
@@ -96,16 +96,44 @@ def set_wcl_value(key, val, wcl):
 
 #######################################################################
 def tar_list(tarfilename, filelist):
-    """ Tars a directory """
+    """ Tars a list of files and directories
 
+        Uses the system tar, fed the names on stdin, so the data doesn't pass
+        through python.  Falls back to the tarfile module if tar can't be run.
+    """
+
+    cmd = ['tar', '--null', '-T', '-', '-cf', tarfilename]
     if tarfilename.endswith('.gz'):
-        mode = 'w:gz'
-    else:
-        mode = 'w'
+        # pigz compresses on all cores, otherwise let tar call gzip
+        if any(os.access(os.path.join(pdir, 'pigz'), os.X_OK)
+               for pdir in os.environ.get('PATH', '').split(os.pathsep)):
+            cmd[1:1] = ['-I', 'pigz']
+        else:
+            cmd.insert(1, '-z')
 
-    with tarfile.open(tarfilename, mode) as tar:
-        for filen in filelist:
-            tar.add(filen)
+    try:
+        process = subprocess.Popen(cmd, stdin=subprocess.PIPE, stderr=subprocess.PIPE)
+    except OSError:
+        print "Could not run tar, using tarfile module instead"
+        if tarfilename.endswith('.gz'):
+            mode = 'w:gz'
+        else:
+            mode = 'w'
+
+        with tarfile.open(tarfilename, mode) as tar:
+            for filen in filelist:
+                tar.add(filen)
+        return
+
+    (_, errout) = process.communicate('\0'.join(filelist))
+    if process.returncode == 1:
+        # GNU tar exits with 1 when a file changed while it was read,
+        # the tarball is still written so only warn
+        print "Warning: tar of %d files into %s exited with 1\n%s" % \
+              (len(filelist), tarfilename, errout)
+    elif process.returncode != 0:
+        raise Exception("Error: tar of %d files into %s exited with %s\n%s" %
+                        (len(filelist), tarfilename, process.returncode, errout))
 
 ############################################################################
 def run_cmd_qcf(cmd, logfilename, execnames):